@@ -0,0 +1,115 @@
+"""Re-inspect a folder of recorded videos or frame dumps on all CPU cores.
+
+Every video file and every sub-folder of images is one job. Jobs run in a
+process pool, each worker writes its verdicts to a part file and the parts
+are merged in input order into a single JSON lines file.
+
+Example:
+    python -m batch --input recordings/2024-05-02 --cable 12pins --output verdicts.jsonl
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from headless import inspect_source
+from inspection import CABLES, build_plan, load_configuration
+from sources import IMAGE_EXTENSIONS
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov")
+
+
+# Function to list the videos and frame folders of a recording directory
+def find_jobs(input_dir):
+    jobs = []
+    for name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, name)
+        if os.path.isdir(path) or name.lower().endswith(VIDEO_EXTENSIONS):
+            jobs.append(path)
+
+    # Loose images directly in the input folder are one more frame dump
+    if any(name.lower().endswith(IMAGE_EXTENSIONS) for name in os.listdir(input_dir)):
+        jobs.append(input_dir)
+    return jobs
+
+
+# Function to set up each worker process
+def init_worker():
+    # One OpenCV thread per process, the pool already uses every core
+    cv2.setNumThreads(1)
+
+
+# Function run in a worker process, inspects one file and writes its verdicts to a part file
+def inspect_job(source, config, cable, part_path):
+    plan = build_plan(config, cable)
+    frames = 0
+    failures = 0
+    with open(part_path, "w") as part:
+        for verdict in inspect_source(source, plan):
+            verdict = {"source": source, **verdict}
+            part.write(json.dumps(verdict) + "\n")
+            frames += 1
+            if not verdict["ok"]:
+                failures += 1
+    return frames, failures
+
+
+# Function to inspect all jobs in parallel and merge the verdicts into one output file
+def run_batch(jobs, config, cable, output_path, workers=None):
+    part_dir = tempfile.mkdtemp(prefix="batch_")
+    part_paths = [os.path.join(part_dir, f"{i:05d}.jsonl") for i in range(len(jobs))]
+    totals = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = {
+                executor.submit(inspect_job, job, config, cable, part_path): job
+                for job, part_path in zip(jobs, part_paths)
+            }
+            for future, job in futures.items():
+                totals[job] = future.result()
+                frames, failures = totals[job]
+                print(f"{job}: {frames} frames, {failures} NOT OK", file=sys.stderr)
+
+        # Merge the parts in input order
+        with open(output_path, "w") as output:
+            for part_path in part_paths:
+                with open(part_path) as part:
+                    shutil.copyfileobj(part, output)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-inspect recorded videos or frame dumps in parallel")
+    parser.add_argument("--input", required=True, help="folder with videos and/or frame folders")
+    parser.add_argument("--cable", default="12pins", choices=sorted(CABLES), help="cable profile to apply")
+    parser.add_argument("--env", default=".env", help="configuration file with the cable profiles")
+    parser.add_argument("--output", default="verdicts.jsonl", help="merged per-frame verdicts")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, defaults to the CPU count")
+    args = parser.parse_args(argv)
+
+    jobs = find_jobs(args.input)
+    if not jobs:
+        print(f"No videos or frame folders found in {args.input}", file=sys.stderr)
+        return 1
+
+    config = load_configuration(args.env)
+    start = time.perf_counter()
+    totals = run_batch(jobs, config, args.cable, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+
+    frames = sum(frames for frames, _ in totals.values())
+    print(f"Inspected {frames} frames from {len(jobs)} files in {elapsed:.2f}s "
+          f"({frames / max(elapsed, 1e-9):.1f} fps), verdicts written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""Benchmark the detection hot path on synthetic frames.
+
+Frames are painted with the configured wire colors at the CABLE12ROI and
+CABLE16ROI positions, then every stage of the per-frame work is timed on
+its own. Results are written as JSON so runs can be compared between
+versions.
+
+A load test then runs the threaded pipeline of the main window on a
+synthetic source read as fast as possible, with the render work of a
+station minus the Tk calls, and reports the frame rate of every stage.
+
+Example:
+    python -m benchmark --iterations 500 --output bench_results.json
+    python -m benchmark --load-seconds 10
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from inspection import (CABLES, FRAME_SIZE, ChangeGate, build_plan, color_order_key, detect_color, get_dominant_color,
+                        load_configuration, prepare_frame)
+from instrumentation import LatencyStats
+from locator import ConnectorLocator, cut_template
+from pipeline import CameraSession, Pipeline
+from sources import make_synthetic_frame
+
+RESOLUTIONS = [(640, 480), (1920, 1080)]
+
+
+# Function to time a callable, returns latency statistics in milliseconds
+def time_stage(func, iterations, warmup=10):
+    for _ in range(warmup):
+        func()
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        samples[i] = time.perf_counter_ns() - start
+    samples /= 1e6
+    mean = float(samples.mean())
+    return {
+        "iterations": iterations,
+        "mean_ms": mean,
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "max_ms": float(samples.max()),
+        "fps": 1000.0 / mean if mean > 0 else None,
+    }
+
+
+# Function to build the PhotoImage timer, returns None when there is no display
+def make_photoimage_stage(prepared):
+    try:
+        import tkinter as tk
+        from PIL import Image, ImageTk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return None, None
+
+    def stage():
+        ImageTk.PhotoImage(image=Image.fromarray(prepared))
+    return stage, root
+
+
+# Function to run every stage benchmark for one cable and one camera resolution
+def benchmark_cable(config, cable, size, iterations):
+    pins_key, roi_key, size_key = CABLES[cable]
+    colors, rois = config[pins_key], config[roi_key]
+    tolerance = config["TOLERANCE"]
+    raw = make_synthetic_frame(colors, rois, config[size_key], size, order=config[color_order_key(cable)])
+    prepared = prepare_frame(raw)
+    plan = build_plan(config, cable)
+    # The per-pin functions read the resized frame, so they need the ROIs at FRAME_SIZE
+    display_rois = plan.scaled_rois(FRAME_SIZE).tolist()
+    pins = [(pin_name, expected_color, display_rois[i])
+            for i, (pin_name, expected_color) in enumerate(colors) if i < len(display_rois)]
+    if not pins:
+        return {}
+
+    def per_pin_loop():
+        # The body of update_frame() without the Tk calls
+        frame = prepare_frame(raw)
+        for pin_name, expected_color, roi in pins:
+            detect_color(frame, expected_color, roi, tolerance)
+            x, y, w, h = roi
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(frame, pin_name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+    def plan_loop():
+        # The same frame work with the batched inspection plan on the raw frame
+        plan.evaluate(raw, bgr=True)
+        frame = prepare_frame(raw)
+        for pin_name, (x, y, w, h) in zip(plan.names, plan.scaled_rois(FRAME_SIZE).tolist()):
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(frame, pin_name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+    first_roi = pins[0][2]
+    first_color = pins[0][1]
+    results = {}
+    results["get_dominant_color"] = time_stage(lambda: get_dominant_color(prepared, first_roi), iterations)
+    results["detect_color"] = time_stage(lambda: detect_color(prepared, first_color, first_roi, tolerance), iterations)
+    results["frame_loop_per_pin"] = time_stage(per_pin_loop, iterations)
+    results["frame_loop_plan"] = time_stage(plan_loop, iterations)
+    results["plan_evaluate"] = time_stage(lambda: plan.evaluate(prepared), iterations)
+    results["plan_evaluate_raw"] = time_stage(lambda: plan.evaluate(raw, bgr=True), iterations)
+    results["cvtcolor_resize"] = time_stage(lambda: prepare_frame(raw), iterations)
+    for metric in ("lab", "hue"):
+        # The first plan of a profile builds the distance table, later plans and frames only look it up
+        started = time.perf_counter()
+        metric_plan = build_plan({**config, "COLOR_METRIC": metric}, cable)
+        results[f"build_plan_{metric}"] = {"ms": (time.perf_counter() - started) * 1000}
+        results[f"plan_evaluate_raw_{metric}"] = time_stage(lambda: metric_plan.evaluate(raw, bgr=True), iterations)
+    # Wire-order identification on a cable with its first two wires swapped
+    swapped = [list(pin) for pin in colors]
+    if len(plan) > 1:
+        swapped[0][1], swapped[1][1] = colors[1][1], colors[0][1]
+    dominant = plan.dominant_colors(make_synthetic_frame(swapped, rois, config[size_key], size,
+                                                         order=config[color_order_key(cable)]))
+    swapped_matches, _ = plan.compare(dominant, bgr=True)
+    results["plan_identify_swap"] = time_stage(lambda: plan.identify(dominant, swapped_matches, bgr=True), iterations)
+    everything_wrong = np.zeros(len(plan), dtype=bool)
+    results["plan_identify_all_failed"] = time_stage(lambda: plan.identify(dominant, everything_wrong, bgr=True),
+                                                     iterations)
+    # Connector search of AUTO_LOCATE, with a template cut from the frame at the calibration size
+    calibration = make_synthetic_frame(colors, rois, config[size_key], config[size_key],
+                                       order=config[color_order_key(cable)])
+    locator = ConnectorLocator(*cut_template(calibration, plan.rois), config[size_key])
+    results["locate_connector"] = time_stage(lambda: locator.locate(raw), iterations)
+    gate = ChangeGate()
+    gate.changed(raw, plan)
+    # A frame that did not change since the last inspected one only costs the gate
+    results["change_gate"] = time_stage(lambda: gate.changed(raw, plan), iterations)
+
+    photoimage, root = make_photoimage_stage(prepared)
+    if photoimage is not None:
+        results["photoimage"] = time_stage(photoimage, iterations)
+        root.destroy()
+    else:
+        results["photoimage"] = {"skipped": "no display available"}
+    return results
+
+
+# Function to do the work of InspectionStation.render() without the Tk calls, releases the raw frame
+def render_offscreen(pipeline, raw, pins, display_buffer):
+    frame = cv2.resize(raw, FRAME_SIZE, dst=display_buffer)
+    pipeline.release(raw)
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=display_buffer)
+    for pin_name, (x, y, w, h) in pins:
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(frame, pin_name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+    return frame
+
+
+# Function to load-test the capture -> detection -> render pipeline on a synthetic source
+def load_test(config, cable, size, seconds):
+    stats = LatencyStats()
+    plan = build_plan(config, cable)
+    if not len(plan):
+        return {}
+    display_buffer = np.empty((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+
+    def inspect(frame):
+        # InspectionStation.inspect() without the diagnostics
+        with stats.time("roi"):
+            matches, _ = plan.evaluate(frame, bgr=True)
+        return frame, list(zip(plan.names, plan.scaled_rois(FRAME_SIZE).tolist())), matches
+
+    session = CameraSession(f"synthetic:{cable}@{size[0]}x{size[1]}", stats, config=config, realtime=False)
+    pipeline = Pipeline(session, inspect, stats)
+    session.start()
+    pipeline.start()
+    rendered = 0
+    not_ok = 0
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            result = pipeline.results.get(timeout=0.1)
+            if result is None:
+                continue
+            raw, pins, matches = result
+            with stats.time("render"):
+                render_offscreen(pipeline, raw, pins, display_buffer)
+            stats.tick("display")
+            rendered += 1
+            # Every synthetic frame shows the expected colors, anything else is a detection bug
+            not_ok += not matches.all()
+    finally:
+        pipeline.stop()
+        session.close()
+
+    summary = stats.summary()
+    summary["rendered"] = rendered
+    summary["not_ok"] = not_ok
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the detection hot path")
+    parser.add_argument("--env", default=".env", help="configuration file with the cable profiles")
+    parser.add_argument("--iterations", type=int, default=200, help="timed iterations per stage")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write the results to")
+    parser.add_argument("--load-seconds", type=float, default=2.0, help="duration of each pipeline load test, 0 skips them")
+    args = parser.parse_args(argv)
+
+    config = load_configuration(args.env)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": {},
+    }
+    for cable in CABLES:
+        for size in RESOLUTIONS:
+            key = f"{cable}@{size[0]}x{size[1]}"
+            report["results"][key] = benchmark_cable(config, cable, size, args.iterations)
+            for stage, stats in report["results"][key].items():
+                if "mean_ms" in stats:
+                    print(f"{key:20} {stage:20} {stats['mean_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms  "
+                          f"{stats['fps']:9.1f} fps", file=sys.stderr)
+
+    if args.load_seconds > 0:
+        report["load"] = {}
+        for cable in CABLES:
+            for size in RESOLUTIONS:
+                key = f"{cable}@{size[0]}x{size[1]}"
+                report["load"][key] = summary = load_test(config, cable, size, args.load_seconds)
+                if summary:
+                    rates = "  ".join(f"{name} {fps:.1f} fps" for name, fps in summary["fps"].items())
+                    print(f"{key:20} load {rates}  not ok {summary['not_ok']}", file=sys.stderr)
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
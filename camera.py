@@ -0,0 +1,218 @@
+"""Open cameras with a capture profile and probe which profile performs best.
+
+A profile is a JSON object stored per camera in the .env as
+CAMERA<index>_PROFILE, every key is optional:
+
+    {"backend": "dshow", "fourcc": "MJPG", "width": 1280, "height": 720,
+     "fps": 30, "buffersize": 1, "exposure": -6}
+
+`exposure` switches auto exposure off and locks the exposure to that value,
+its scale depends on the camera driver.
+
+The ROIs are scaled to whatever resolution the camera delivers, which only
+keeps them on the pins when the aspect ratio is the one they were
+calibrated at (CABLE12ROI_SIZE / CABLE16ROI_SIZE of the camera's cable).
+The probe skips candidates of any other aspect ratio, and results the
+driver delivered at another one.
+
+Examples:
+    python -m camera --camera 0 --probe            # try the default candidates and save the best
+    python -m camera --camera 0 --probe --candidates profiles.json --no-save
+"""
+import argparse
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from inspection import CABLES, load_configuration
+
+BACKENDS = {
+    "any": cv2.CAP_ANY,
+    "dshow": cv2.CAP_DSHOW,
+    "msmf": cv2.CAP_MSMF,
+    "v4l2": cv2.CAP_V4L2,
+    "avfoundation": cv2.CAP_AVFOUNDATION,
+}
+
+# Value of CAP_PROP_AUTO_EXPOSURE that selects manual exposure on V4L2 and DirectShow
+MANUAL_EXPOSURE = 0.25
+
+# Candidates tried by the probe when no list is given
+DEFAULT_CANDIDATES = [
+    {"fourcc": fourcc, "width": width, "height": height, "fps": fps, "buffersize": 1}
+    for fourcc in ("MJPG", "YUYV")
+    for width, height in ((640, 480), (1280, 720), (1920, 1080))
+    for fps in (30, 60)
+]
+
+
+# Largest relative difference between two aspect ratios that still counts as the same
+ASPECT_TOLERANCE = 0.01
+
+
+# Function to get the .env key holding the profile of a camera
+def profile_key(camera_index):
+    return f"CAMERA{camera_index}_PROFILE"
+
+
+# Function to open a camera and apply a capture profile to it
+def open_camera(camera_index, profile=None):
+    profile = profile or {}
+    cap = cv2.VideoCapture(camera_index, BACKENDS[profile.get("backend", "any")])
+    apply_profile(cap, profile)
+    return cap
+
+
+# Function to set the properties of a profile on an open capture, the format goes first
+# because most drivers only accept the sizes and frame rates of the current format
+def apply_profile(cap, profile):
+    if "fourcc" in profile:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*profile["fourcc"]))
+    if "width" in profile:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, profile["width"])
+    if "height" in profile:
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, profile["height"])
+    if "fps" in profile:
+        cap.set(cv2.CAP_PROP_FPS, profile["fps"])
+    if "buffersize" in profile:
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, profile["buffersize"])
+    if "exposure" in profile:
+        cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, MANUAL_EXPOSURE)
+        cap.set(cv2.CAP_PROP_EXPOSURE, profile["exposure"])
+
+
+# Function to read back what the driver actually accepted
+def describe(cap):
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    return {
+        "fourcc": "".join(chr((fourcc >> shift) & 0xFF) for shift in (0, 8, 16, 24)).strip("\0"),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS),
+    }
+
+
+# Function to measure one profile: delivered frame rate and cap.read() latency
+def probe_profile(camera_index, profile, frames=90, warmup=15):
+    cap = open_camera(camera_index, profile)
+    try:
+        if not cap.isOpened():
+            return {"profile": profile, "error": "camera did not open"}
+        actual = describe(cap)
+        frame = None
+        for _ in range(warmup):  # Let the driver fill its buffers and settle exposure
+            cap.read(frame)
+
+        read_times = np.empty(frames)
+        start = time.perf_counter()
+        for i in range(frames):
+            read_start = time.perf_counter()
+            ret, frame = cap.read(frame)
+            read_times[i] = time.perf_counter() - read_start
+            if not ret:
+                return {"profile": profile, "actual": actual, "error": f"read failed after {i} frames"}
+        elapsed = time.perf_counter() - start
+    finally:
+        cap.release()
+
+    read_times *= 1000
+    return {
+        "profile": profile,
+        "actual": actual,
+        "shape": list(frame.shape),
+        "fps": frames / elapsed,
+        "read_p50_ms": float(np.percentile(read_times, 50)),
+        "read_p95_ms": float(np.percentile(read_times, 95)),
+    }
+
+
+# Function to get the (width, height) the ROIs of a camera's cable were calibrated at, None when
+# the camera has no cable with calibrated ROIs
+def calibrated_size(config, camera_index):
+    for index, cable in config["CAMERAS"]:
+        _, roi_key, size_key = CABLES[cable]
+        if str(index) == str(camera_index) and config[roi_key]:
+            return config[size_key]
+    return None
+
+
+# Function to tell whether a (width, height) has the aspect ratio of `size`, always True without a size
+def same_aspect(width, height, size):
+    if size is None:
+        return True
+    return abs(width * size[1] / (height * size[0]) - 1) <= ASPECT_TOLERANCE
+
+
+# Function to pick the best probe result: the highest delivered frame rate, then the steadiest reads.
+# With a calibrated `size`, only frames delivered at its aspect ratio count.
+def best_result(results, size=None):
+    usable = [result for result in results if "error" not in result
+              and same_aspect(result["shape"][1], result["shape"][0], size)]
+    if not usable:
+        return None
+    return max(usable, key=lambda result: (round(result["fps"]), -result["read_p95_ms"]))
+
+
+# Function to probe every candidate profile of a camera, yields one result per candidate. With a
+# calibrated `size`, candidates asking for another aspect ratio are not opened.
+def probe(camera_index, candidates=None, frames=90, size=None):
+    for profile in candidates or DEFAULT_CANDIDATES:
+        if "width" in profile and "height" in profile and not same_aspect(profile["width"], profile["height"], size):
+            yield {"profile": profile, "error": f"aspect ratio differs from the calibrated {size[0]}x{size[1]}"}
+            continue
+        yield probe_profile(camera_index, profile, frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe the capture profiles of a camera")
+    parser.add_argument("--camera", type=int, default=0, help="camera index")
+    parser.add_argument("--probe", action="store_true", help="measure every candidate profile")
+    parser.add_argument("--candidates", help="JSON file with a list of candidate profiles")
+    parser.add_argument("--frames", type=int, default=90, help="frames timed per profile")
+    parser.add_argument("--env", default=".env", help="configuration file the best profile is saved to")
+    parser.add_argument("--no-save", action="store_true", help="only report, do not save the best profile")
+    args = parser.parse_args(argv)
+
+    if not args.probe:
+        cap = open_camera(args.camera)
+        print(json.dumps(describe(cap)))
+        cap.release()
+        return 0
+
+    candidates = None
+    if args.candidates:
+        with open(args.candidates) as candidates_file:
+            candidates = json.load(candidates_file)
+
+    # Profiles at another aspect ratio would move the ROIs off the pins
+    size = calibrated_size(load_configuration(args.env), args.camera)
+    results = []
+    for result in probe(args.camera, candidates, args.frames, size):
+        results.append(result)
+        if "error" in result:
+            print(f"{json.dumps(result['profile'])}: {result['error']}", file=sys.stderr)
+        else:
+            print(f"{json.dumps(result['profile'])}: {result['fps']:.1f} fps, read p50 {result['read_p50_ms']:.1f} ms "
+                  f"p95 {result['read_p95_ms']:.1f} ms, got {result['actual']}", file=sys.stderr)
+            if not same_aspect(result["shape"][1], result["shape"][0], size):
+                print(f"  skipped, delivered {result['shape'][1]}x{result['shape'][0]} but the ROIs were "
+                      f"calibrated at {size[0]}x{size[1]}", file=sys.stderr)
+
+    best = best_result(results, size)
+    if best is None:
+        print("No profile worked" if size is None else
+              f"No profile worked at the calibrated aspect ratio of {size[0]}x{size[1]}", file=sys.stderr)
+        return 1
+    print(json.dumps(best))
+    if not args.no_save:
+        from config_store import update_config
+        update_config(args.env, {profile_key(args.camera): json.dumps(best["profile"])})
+        print(f"Saved {profile_key(args.camera)} to {args.env}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
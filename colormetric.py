@@ -0,0 +1,76 @@
+"""Perceptual color distances through a precomputed lookup table.
+
+The metric is picked with COLOR_METRIC in the .env:
+
+    rgb  largest per-channel difference, checked against TOLERANCE per channel (default)
+    lab  CIE76 delta E, the Euclidean distance in CIELAB, a just noticeable
+         difference is about 2.3 and wires of different colors are usually 20+ apart
+    hue  HSV hue angle in degrees (0-180), robust to shadows and exposure.
+         When either color is nearly gray, the saturation and value
+         difference decide instead, scaled to the same 0-180 range.
+
+For lab and hue, the distance of every quantized BGR color to every
+expected color of a profile is computed once. The distance of an ROI mean
+is then a single table lookup, with no color-space conversion per frame.
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+METRICS = ("rgb", "lab", "hue")
+LUT_BITS = 6  # Levels per channel are 2 ** LUT_BITS, a mean is off by at most half a step
+ACHROMATIC = 0.15  # Saturation or value below which the hue of a color is meaningless
+
+
+# Function to get the table cell of BGR colors, works on (N, 3) arrays
+def lut_index(bgr):
+    q = np.asarray(bgr, dtype=np.int32) >> (8 - LUT_BITS)
+    return (q[:, 0] << (2 * LUT_BITS)) | (q[:, 1] << LUT_BITS) | q[:, 2]
+
+
+# Function to get the BGR color at the center of every table cell, in lut_index() order
+def _cell_colors():
+    levels = 1 << LUT_BITS
+    step = 256 // levels
+    values = np.arange(levels, dtype=np.uint8) * step + step // 2
+    b, g, r = np.meshgrid(values, values, values, indexing="ij")
+    return np.stack((b.ravel(), g.ravel(), r.ravel()), axis=1)
+
+
+# Function to convert uint8 BGR colors of shape (N, 3) to another color space with float precision
+def _convert(bgr, code):
+    image = (np.asarray(bgr, dtype=np.float32) / 255).reshape(-1, 1, 3)
+    return cv2.cvtColor(image, code).reshape(-1, 3)
+
+
+# Function to compute the distance of every color in `colors` to every color in `expected`, both BGR
+def distances(metric, colors, expected):
+    if metric == "lab":
+        lab = _convert(colors, cv2.COLOR_BGR2Lab)
+        expected_lab = _convert(expected, cv2.COLOR_BGR2Lab)
+        return np.linalg.norm(lab[:, np.newaxis, :] - expected_lab[np.newaxis, :, :], axis=2)
+    if metric == "hue":
+        hsv = _convert(colors, cv2.COLOR_BGR2HSV)  # H in degrees, S and V in 0-1
+        expected_hsv = _convert(expected, cv2.COLOR_BGR2HSV)
+        h, s, v = (hsv[:, np.newaxis, i] for i in range(3))
+        eh, es, ev = (expected_hsv[np.newaxis, :, i] for i in range(3))
+        hue = np.abs(h - eh)
+        hue = np.minimum(hue, 360 - hue)  # Angle between the hues, 0-180 degrees
+        gray = np.maximum(np.abs(s - es), np.abs(v - ev)) * 180  # Same 0-180 scale
+        achromatic = (np.minimum(s, v) < ACHROMATIC) | (np.minimum(es, ev) < ACHROMATIC)
+        return np.where(achromatic, gray, hue)
+    raise ValueError(f"Unknown color metric {metric!r}, expected one of {', '.join(METRICS)}")
+
+
+@lru_cache(maxsize=8)
+def _build_lut(metric, expected_bgr):
+    table = distances(metric, _cell_colors(), np.array(expected_bgr, dtype=np.uint8).reshape(-1, 3))
+    return np.minimum(np.rint(table), 255).astype(np.uint8)
+
+
+# Function to get the (cells, pins) distance table of a profile, built once and cached by metric and colors.
+# The tolerance is applied after the lookup, so one table serves every tolerance.
+def color_lut(metric, expected_rgb):
+    expected_bgr = np.clip(np.asarray(expected_rgb), 0, 255).astype(np.uint8).reshape(-1, 3)[:, ::-1]
+    return _build_lut(metric, tuple(map(tuple, expected_bgr.tolist())))
@@ -0,0 +1,188 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from dotenv import dotenv_values
+
+from diaglog import INFO, WARNING, diagnostics
+from inspection import CABLES, TRUE_VALUES, build_plan, parse_configuration, plan_keys
+
+# Serializes read-modify-write cycles of writers in this process (settings form, calibrators)
+_write_lock = threading.Lock()
+
+
+# Function to read the raw .env string of an on/off key, `default` applies when it is not set or empty
+def is_enabled(value, default=False):
+    return value.lower() in TRUE_VALUES if value else default
+
+
+class ConfigSnapshot:
+    """One parsed version of the configuration file, never modified after creation"""
+
+    def __init__(self, values, config, plans, version):
+        self.values = values  # Raw .env strings
+        self.config = config  # Typed values, as returned by load_configuration()
+        self.plans = plans  # Compiled InspectionPlan per cable
+        self.version = version
+
+    def flag(self, key, default=False):
+        """On/off value of a key, see is_enabled()"""
+        return is_enabled(self.values.get(key), default)
+
+
+class ConfigStore:
+    """Cable profiles read from a .env file and compiled once.
+
+    `refresh()` only stats the file when nothing changed, and only reads and
+    hashes it when the modification time or size moved. Cables whose keys
+    did not change keep their compiled InspectionPlan, so their ROI slices
+    are not recompiled. Every refresh publishes a new ConfigSnapshot
+    with a single assignment, readers on other threads take `snapshot` once
+    and never see a half-updated configuration.
+    """
+
+    def __init__(self, path=".env"):
+        self.path = path
+        config = parse_configuration({})
+        # Until the first refresh every cable has an empty profile
+        self.snapshot = ConfigSnapshot({}, config, {cable: build_plan(config, cable) for cable in CABLES}, 0)
+        self._stat = None
+        self._digest = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Reload the file if it changed, returns True when a new snapshot was published.
+
+        Raises OSError if the file cannot be read and ValueError if it holds
+        an invalid profile, the previous snapshot stays active in both cases.
+        """
+        with self._lock:
+            stat = os.stat(self.path)
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+            if stat_key == self._stat:
+                return False
+
+            with open(self.path, "rb") as config_file:
+                content = config_file.read()
+            digest = hashlib.sha1(content).digest()
+            self._stat = stat_key
+            if digest == self._digest:
+                return False  # Touched but not modified
+
+            values = dotenv_values(stream=io.StringIO(content.decode("utf-8")))
+            config = parse_configuration(values)
+            plans = {cable: self._compile(cable, values, config) for cable in CABLES}
+            self._digest = digest
+            self.snapshot = ConfigSnapshot(values, config, plans, self.snapshot.version + 1)
+            return True
+
+    def _compile(self, cable, values, config):
+        # Reuse the plan of the previous snapshot when none of the cable's keys changed
+        keys = plan_keys(cable)
+        previous = self.snapshot
+        plan = previous.plans[cable]
+        if previous.version and all(values.get(key) == previous.values.get(key) for key in keys):
+            return plan
+        return build_plan(config, cable)
+
+    @property
+    def config(self):
+        return self.snapshot.config
+
+    def get(self, key, default=None):
+        """Raw string value of a key, or default when it is not set"""
+        value = self.snapshot.values.get(key)
+        return default if value is None else value
+
+    def flag(self, key, default=False):
+        """On/off value of a key, see is_enabled()"""
+        return self.snapshot.flag(key, default)
+
+    def plan(self, cable):
+        """The compiled InspectionPlan of a cable"""
+        return self.snapshot.plans[cable]
+
+
+class ConfigWatcher(threading.Thread):
+    """Polls a ConfigStore in the background and reports new snapshots.
+
+    Each poll is a single os.stat while the file is unchanged. `on_change`
+    is called from this thread with the new snapshot, it must only do
+    thread-safe work such as swapping a reference, and leave widget updates
+    to the GUI thread. An invalid file is logged and the previous snapshot
+    stays active until the file is fixed.
+    """
+
+    def __init__(self, store, on_change, interval=0.25):
+        super().__init__(daemon=True)
+        self.store = store
+        self.on_change = on_change
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                changed = self.store.refresh()
+            except Exception as e:  # Any bad edit, the watcher must outlive it
+                diagnostics.log(WARNING, "config_rejected", path=self.store.path, error=f"{type(e).__name__}: {e}")
+                continue
+            if changed:
+                diagnostics.log(INFO, "config_reloaded", path=self.store.path, version=self.store.snapshot.version)
+                try:
+                    self.on_change(self.store.snapshot)
+                except Exception as e:  # A consumer failing on the new snapshot must not end hot reload
+                    diagnostics.log(WARNING, "config_apply_failed", path=self.store.path,
+                                    error=f"{type(e).__name__}: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+# Function to replace a file with new content in one step, readers see the old or the new file, never a mix
+def write_config_file(path, content):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".env.", suffix=".tmp", dir=directory)
+    try:
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as temp_file:
+            temp_file.write(content)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+# Function to set several keys of a .env file in a single atomic write.
+# Values are written single-quoted like dotenv.set_key() does, other lines are kept as they are.
+def update_config(path, updates):
+    with _write_lock:
+        try:
+            with open(path, encoding="utf-8", newline="") as config_file:
+                lines = config_file.read().splitlines(keepends=True)
+        except FileNotFoundError:
+            lines = []
+
+        missing = dict(updates)
+        for i, line in enumerate(lines):
+            match = re.match(r"\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_.]*)\s*=", line)
+            if match and match.group(1) in updates:
+                key = match.group(1)
+                lines[i] = _format_line(key, updates[key])
+                missing.pop(key, None)
+        if missing and lines and not lines[-1].endswith(("\n", "\r")):
+            lines[-1] += "\n"
+        lines.extend(_format_line(key, value) for key, value in missing.items())
+
+        write_config_file(path, "".join(lines))
+
+
+def _format_line(key, value):
+    return "{}='{}'\n".format(key, str(value).replace("'", "\\'"))
@@ -0,0 +1,122 @@
+import atexit
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+FALLBACK_FILE = "diagnostics.log"  # Written next to the program when there is no stderr, as in the windowed exe
+
+
+class DiagnosticLog:
+    """Structured log kept in an in-memory ring buffer.
+
+    `log()` only appends a record to a bounded deque, so the hot path never
+    waits on console or file I/O. A background thread writes new records as
+    JSON lines every `flush_interval` seconds. Records below `level` are
+    discarded, and `sample_every` keeps only one record out of every N of the
+    same event. If the writer falls behind the oldest records are dropped
+    and counted instead of blocking the caller. Without a stream and without
+    stderr, records go to FALLBACK_FILE next to the program, or are dropped
+    when it cannot be opened.
+    """
+
+    def __init__(self, capacity=4096, level=INFO, sample_every=1, stream=None, flush_interval=0.5):
+        self.level = level
+        self.sample_every = sample_every
+        self.stream = stream  # Defaults to sys.stderr at write time
+        self.flush_interval = flush_interval
+        self.dropped = 0
+
+        self._records = deque(maxlen=capacity)
+        self._sequence = itertools.count()
+        self._written = -1  # Sequence number of the last written record
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._writer = None
+        self._fallback = None  # Open FALLBACK_FILE, False when it could not be opened
+
+    def configure(self, level=None, sample_every=None, stream=None):
+        """Change the level (name or number), sampling rate or output stream"""
+        if level is not None:
+            self.level = LEVELS[level.upper()] if isinstance(level, str) else level
+        if sample_every is not None:
+            self.sample_every = max(1, int(sample_every))
+        if stream is not None:
+            self.stream = stream
+
+    def enabled(self, level):
+        """Cheap check so callers can skip building the fields of filtered records"""
+        return level >= self.level
+
+    def log(self, level, event, **fields):
+        if level < self.level:
+            return
+        if self.sample_every > 1:
+            count = self._counters.get(event, 0)
+            self._counters[event] = count + 1
+            if count % self.sample_every:
+                return
+        record = {"ts": time.time(), "level": level, "event": event, **fields}
+        self._records.append((next(self._sequence), record))
+        if self._writer is None:
+            self._start_writer()
+
+    def recent(self, count=None):
+        """The most recent records still held in the ring buffer"""
+        records = [record for _, record in list(self._records)]
+        return records if count is None else records[-count:]
+
+    def flush(self):
+        """Write all records that were not written yet"""
+        with self._lock:
+            pending = [(sequence, record) for sequence, record in list(self._records) if sequence > self._written]
+            if not pending:
+                return
+            if pending[0][0] > self._written + 1:
+                self.dropped += pending[0][0] - self._written - 1
+            stream = self.stream or sys.stderr or self._fallback_stream()
+            if stream:
+                stream.write("".join(json.dumps(record, default=str) + "\n" for _, record in pending))
+                stream.flush()
+            self._written = pending[-1][0]
+
+    def _fallback_stream(self):
+        if self._fallback is None:
+            program = sys.executable if getattr(sys, "frozen", False) else sys.argv[0]
+            path = os.path.join(os.path.dirname(os.path.abspath(program)), FALLBACK_FILE)
+            try:
+                self._fallback = open(path, "a", encoding="utf-8")
+            except OSError:
+                self._fallback = False
+        return self._fallback
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+            atexit.register(self._safe_flush)
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._safe_flush()
+
+    def _safe_flush(self):
+        try:
+            self.flush()
+        except (OSError, ValueError):
+            pass  # The stream was closed, keep the records in memory
+
+
+# Shared log used by the inspection code
+diagnostics = DiagnosticLog()
@@ -0,0 +1,360 @@
+"""Shared-memory frame bus between a capture process and any number of readers.
+
+The capture process decodes camera frames straight into a ring of slots in
+a `multiprocessing.shared_memory` block. Every frame gets a sequence number,
+readers look up the newest one and read the slot in place, without copying
+and without talking to the capture process. The main window, the
+calibrators and the headless CLI can all read the same camera at once.
+
+Example:
+    python -m framebus --camera 0              # publish camera 0 as ribonizado_cam0
+    python -m headless --source bus:ribonizado_cam0 --cable 12pins
+"""
+import argparse
+import json
+import os
+import runpy
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import cv2
+import numpy as np
+
+from camera import open_camera
+from diaglog import WARNING, diagnostics
+from pipeline import FramePool, SessionReader
+
+HEADER_SIZE = 64  # Bytes before the slot table: latest sequence, height, width, channels, slots
+WRITING = -1  # Slot sequence while the capture process is writing into it
+RUN_MODULE = "--run-module"  # First argument of the frozen exe that runs one of its modules instead of the GUI
+
+
+# Function to build the command that runs one of the app's modules in a child process. The
+# PyInstaller exe has no `python -m`, it runs the module through RUN_MODULE, see run_module_command().
+def module_command(module, args=()):
+    if getattr(sys, "frozen", False):
+        return [sys.executable, RUN_MODULE, module, *args]
+    return [sys.executable, "-m", module, *args]
+
+
+# Function to run the module of a RUN_MODULE command line as __main__, returns False for any other command line
+def run_module_command(argv):
+    if len(argv) < 3 or argv[1] != RUN_MODULE:
+        return False
+    sys.argv = [argv[2], *argv[3:]]
+    runpy.run_module(argv[2], run_name="__main__", alter_sys=True)
+    return True
+
+
+# Function to name the bus of a camera
+def bus_name(camera_index):
+    return f"ribonizado_cam{camera_index}"
+
+
+class FrameBus:
+    """Ring of frame slots in shared memory.
+
+    Layout: an int64 header, one int64 sequence and one float64 timestamp
+    per slot, then the frames. The writer marks a slot WRITING before
+    filling it and stores the frame's sequence after, so a reader can tell
+    a complete frame from one that is being overwritten.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner  # Only the creating process unlinks the block
+        self.header = np.ndarray((HEADER_SIZE // 8,), dtype=np.int64, buffer=shm.buf)
+        height, width, channels, slots = (int(value) for value in self.header[1:5])
+        self.shape = (height, width, channels)
+        self.slots = slots
+        self.sequences = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=HEADER_SIZE)
+        self.timestamps = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=HEADER_SIZE + 8 * slots)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=shm.buf,
+                                 offset=self._frames_offset(slots))
+
+    @staticmethod
+    def _frames_offset(slots):
+        return (HEADER_SIZE + 16 * slots + 63) // 64 * 64  # Keep the frames 64-byte aligned
+
+    @classmethod
+    def create(cls, name, shape, slots=4):
+        """Create the shared block for frames of `shape` (height, width, channels)"""
+        size = cls._frames_offset(slots) + slots * int(np.prod(shape))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_SIZE // 8,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[0] = -1  # No frame yet
+        header[1:5] = (*shape, slots)
+        del header  # Release the view so close() is not blocked
+        bus = cls(shm, owner=True)
+        bus.sequences[:] = WRITING
+        return bus
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to an existing bus, raises FileNotFoundError if it does not exist yet"""
+        shm = shared_memory.SharedMemory(name=name)
+        # Readers must not unlink the block when they exit, only the capture process owns it. Only
+        # POSIX tracks shared memory, on Windows the block goes away with its last handle.
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def latest(self):
+        """Sequence number of the newest complete frame, -1 before the first one"""
+        return int(self.header[0])
+
+    def begin(self):
+        """Claim the slot of the next frame, returns the array to write it into"""
+        sequence = self.latest + 1
+        slot = sequence % self.slots
+        self.sequences[slot] = WRITING
+        return self.frames[slot]
+
+    def commit(self, timestamp):
+        """Publish the frame written into the slot returned by begin()"""
+        sequence = self.latest + 1
+        slot = sequence % self.slots
+        self.timestamps[slot] = timestamp
+        self.sequences[slot] = sequence
+        self.header[0] = sequence
+
+    def get(self, sequence):
+        """Zero-copy view of a frame and its timestamp, or None if its slot was reused"""
+        slot = sequence % self.slots
+        if self.sequences[slot] != sequence:
+            return None
+        return self.frames[slot], float(self.timestamps[slot])
+
+    def valid(self, sequence):
+        """True while the frame `sequence` has not been overwritten, check after reading a view"""
+        return self.sequences[sequence % self.slots] == sequence
+
+    def close(self):
+        # Drop our views first, SharedMemory.close() fails while they exist
+        self.header = self.sequences = self.timestamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A caller still holds a view, the mapping goes away with it
+        if self.owner:
+            self.shm.unlink()
+
+
+# Function to attach to a bus, waiting for the capture process to create it
+def wait_for_bus(name, timeout=None, stop_event=None):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            return FrameBus.attach(name)
+        except FileNotFoundError:
+            if stop_event is not None and stop_event.is_set():
+                return None
+            if deadline is not None and time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+class FrameBusReader:
+    """Reads the newest frames of a bus.
+
+    `frames()` yields zero-copy views for consumers that only look at a
+    frame briefly. `read()` mimics cv2.VideoCapture and returns a private
+    copy, for callers such as the calibrators that keep the frame around.
+    """
+
+    def __init__(self, name, timeout=2.0):
+        self.bus = wait_for_bus(name, timeout)
+        self.timeout = timeout
+        self.sequence = -1  # Last sequence handed out
+        self._copy = None
+
+    def next(self):
+        """Wait for a newer frame, returns (sequence, view, timestamp) or None on timeout"""
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            latest = self.bus.latest
+            if latest > self.sequence:
+                frame = self.bus.get(latest)
+                if frame is not None:
+                    self.sequence = latest
+                    return (latest,) + frame
+            time.sleep(0.001)
+        return None
+
+    def frames(self):
+        """Yield (sequence, view) pairs until the bus stops publishing"""
+        while True:
+            item = self.next()
+            if item is None:
+                return
+            sequence, view, _ = item
+            yield sequence, view
+            if not self.bus.valid(sequence):
+                # The consumer was slower than the ring, its result may come from a mixed frame
+                diagnostics.log(WARNING, "frame_overrun", sequence=sequence)
+
+    def read(self):
+        item = self.next()
+        if item is None:
+            return False, None
+        sequence, view, _ = item
+        if self._copy is None or self._copy.shape != view.shape:
+            self._copy = np.empty_like(view)
+        np.copyto(self._copy, view)
+        if not self.bus.valid(sequence):
+            return self.read()  # Overwritten while copying, take the next one
+        return True, self._copy
+
+    def release(self):
+        self.bus.close()
+
+
+# Function run in the capture process, publishes a camera into a bus until stop_event is set
+def run_capture(camera_index, name, stop_event, slots=4, profile=None):
+    cv2.setNumThreads(1)
+    cap = open_camera(camera_index, profile)
+    bus = None
+    try:
+        # The first frame tells the size of the shared block
+        frame = None
+        while frame is None and not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                frame = None
+                time.sleep(0.01)
+        if frame is None:
+            return
+        try:
+            bus = FrameBus.create(name, frame.shape, slots)
+        except FileExistsError:
+            # Left behind by a capture process that was killed, replace it
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            bus = FrameBus.create(name, frame.shape, slots)
+        np.copyto(bus.begin(), frame)
+        bus.commit(time.time())
+
+        while not stop_event.is_set():
+            slot = bus.begin()
+            ret, frame = cap.read(slot)  # Decode straight into shared memory
+            if not ret:
+                time.sleep(0.01)  # Avoid spinning when the camera is not ready
+                continue
+            if frame is not slot:
+                continue  # The camera changed resolution, the bus keeps its size
+            bus.commit(time.time())
+    finally:
+        cap.release()
+        if bus is not None:
+            bus.close()
+
+
+class BusSession:
+    """CameraSession that captures in a separate process through a FrameBus.
+
+    Has the same attach/detach/reader interface as CameraSession, so the
+    inspection Pipeline runs unchanged. Each new frame is copied once from
+    the bus into a pool buffer, which decouples the pipeline and the display
+    from the ring. Other processes can attach to the bus at the same time.
+    The capture process is started as `python -m framebus`, or through the
+    exe's RUN_MODULE command when frozen, rather than with multiprocessing,
+    so it never re-imports the GUI module.
+    """
+
+    def __init__(self, camera_index, stats=None, slots=4, profile=None):
+        self.camera_index = camera_index
+        self.name = bus_name(camera_index)
+        self.slots = slots
+        self.profile = profile  # Capture profile, see camera.py
+        self.stats = stats  # Optional LatencyStats
+        self.pool = FramePool()
+        self.out_queue = None
+        self.process = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        args = ["--camera", str(self.camera_index), "--name", self.name, "--slots", str(self.slots)]
+        if self.profile:
+            args += ["--profile", json.dumps(self.profile)]
+        self.process = subprocess.Popen(module_command("framebus", args))
+        self.thread.start()
+
+    def close(self, timeout=2.0):
+        """Stop the capture process, which releases the camera and removes the bus"""
+        self.stop_event.set()
+        self.thread.join(timeout)
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def attach(self, queue):
+        self.out_queue = queue
+
+    def detach(self, queue):
+        if self.out_queue is queue:
+            self.out_queue = None
+
+    def reader(self, timeout=2.0):
+        return SessionReader(self, timeout)
+
+    def _run(self):
+        bus = wait_for_bus(self.name, stop_event=self.stop_event)
+        if bus is None:
+            return
+        try:
+            sequence = -1
+            while not self.stop_event.is_set():
+                latest = bus.latest
+                out_queue = self.out_queue
+                if latest == sequence or out_queue is None:
+                    sequence = latest
+                    time.sleep(0.001)
+                    continue
+                start = time.perf_counter()
+                item = bus.get(latest)
+                if item is None:
+                    continue
+                view, timestamp = item
+                frame = self.pool.acquire(view.shape)
+                np.copyto(frame, view)
+                sequence = latest
+                if not bus.valid(latest):
+                    self.pool.release(frame)  # Overwritten while copying
+                    continue
+                if self.stats is not None:
+                    self.stats.record("read", time.perf_counter() - start)
+                    self.stats.tick("capture")
+                out_queue.put((timestamp, frame))
+        finally:
+            bus.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish a camera on a shared-memory frame bus")
+    parser.add_argument("--camera", type=int, default=0, help="camera index")
+    parser.add_argument("--name", help="bus name, defaults to ribonizado_cam<camera>")
+    parser.add_argument("--slots", type=int, default=4, help="frames kept in the ring")
+    parser.add_argument("--profile", type=json.loads, help="capture profile as JSON, see camera.py")
+    args = parser.parse_args(argv)
+
+    # Stop cleanly on Ctrl+C or terminate() so the bus is removed
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    run_capture(args.camera, args.name or bus_name(args.camera), stop_event, args.slots, args.profile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Run the cable inspection without a GUI.
+
+Examples:
+    python -m headless --source 0 --cable 12pins
+    python -m headless --source shift1.mp4 --cable 16pins --format jsonl
+    python -m headless --source frames/ --cable 12pins --changes-only
+    python -m headless --source bus:ribonizado_cam0 --cable 12pins
+    python -m headless --source synthetic:12pins --cable 12pins --frames 1000
+    python -m headless --source shift1.mp4 --cable 12pins --parts
+    python -m headless --source shift1.mp4 --cable 12pins --locate
+"""
+import argparse
+import json
+import sys
+import time
+
+from diaglog import LEVELS, diagnostics
+from inspection import CABLES, build_plan, load_configuration
+from locator import PlanAligner
+from presence import STABLE, PartTracker
+from sources import iter_source, open_source
+from wiring import format_wiring, wiring_faults
+
+
+# Function to yield (frame_id, frame) pairs from any source of sources.py. Video frames are
+# decoded into the same buffer every time and bus frames are views of shared memory, copy a
+# frame to keep it.
+def iter_frames(source, profile=None, config=None, realtime=False):
+    cap = open_source(source, profile, config, realtime)
+    try:
+        yield from iter_source(cap)
+    finally:
+        cap.release()
+
+
+# Function to inspect every frame of a source, yields one verdict dictionary per frame
+def inspect_source(source, plan, profile=None, config=None, realtime=False, aligner=None):
+    base = plan
+    for frame_id, frame in iter_frames(source, profile, config, realtime):
+        if aligner is not None:
+            plan = aligner.align(frame, base)  # ROIs moved onto the connector, see locator.py
+        dominant = plan.dominant_colors(frame)
+        matches, distances = plan.compare(dominant, bgr=True)
+        ok = bool(matches.all())
+        yield {
+            "frame": frame_id,
+            "ok": ok,
+            "pins": [
+                {"name": name, "ok": bool(matched), "distance": int(distance)}
+                for name, matched, distance in zip(plan.names, matches, distances)
+            ],
+            # Swapped and wrong wires among the failed pins
+            "wiring": [] if ok else wiring_faults(plan.names, plan.identify(dominant, matches, bgr=True)),
+        }
+
+
+# Function to inspect only the cables seated in the fixture, yields one record per part when it is removed
+def inspect_parts(source, plan, profile=None, config=None, realtime=False, aligner=None):
+    tracker = PartTracker()
+    for frame_id, frame in iter_frames(source, profile, config, realtime):
+        record = tracker.update(frame, plan, frame_id)
+        if record is not None:
+            yield record
+        if tracker.state == STABLE:
+            located = aligner.align(frame, plan) if aligner is not None else plan
+            dominant = located.dominant_colors(frame)
+            matches, _ = located.compare(dominant, bgr=True)
+            wiring = None if matches.all() else located.identify(dominant, matches, bgr=True)
+            tracker.judge(plan.names, matches, wiring=wiring)
+
+
+# Function to format a part record as a single line of text
+def format_part(record):
+    text = f"part {record['part']} (frames {record['inserted_frame']}-{record['removed_frame']}): "
+    text += "OK" if record["ok"] else "NOT OK"
+    if record["failed"]:
+        text += " (" + ", ".join(record["failed"]) + ")"
+    if record.get("wiring"):
+        text += " [" + format_wiring(record["wiring"]) + "]"
+    return text
+
+
+# Function to format a verdict as a single line of text
+def format_verdict(verdict):
+    failed = [pin["name"] for pin in verdict["pins"] if not pin["ok"]]
+    text = f"{verdict['frame']}: {'OK' if verdict['ok'] else 'NOT OK'}"
+    if failed:
+        text += " (" + ", ".join(failed) + ")"
+    if verdict["wiring"]:
+        text += " [" + format_wiring(verdict["wiring"]) + "]"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect cables without the GUI")
+    parser.add_argument("--source", default="0", help="camera index, video file, image folder, bus:<name> or synthetic:<cable>")
+    parser.add_argument("--cable", default="12pins", choices=sorted(CABLES), help="cable profile to apply")
+    parser.add_argument("--env", default=".env", help="configuration file with the cable profiles")
+    parser.add_argument("--format", default="text", choices=["text", "jsonl"], help="output format")
+    parser.add_argument("--realtime", action="store_true", help="pace files, folders and synthetic sources at their frame rate")
+    parser.add_argument("--frames", type=int, help="stop after this many frames")
+    parser.add_argument("--parts", action="store_true",
+                        help="start with an empty fixture and print one record per cable seated and removed")
+    parser.add_argument("--locate", action="store_true",
+                        help="follow the connector with the template saved at calibration, like AUTO_LOCATE")
+    parser.add_argument("--changes-only", action="store_true", help="only print when the verdict changes")
+    parser.add_argument("--log-level", default="INFO", type=str.upper, choices=LEVELS,
+                        help="diagnostic log level, DEBUG logs every pin")
+    parser.add_argument("--log-sample", type=int, default=1, help="keep one diagnostic record out of every N")
+    args = parser.parse_args(argv)
+
+    diagnostics.configure(args.log_level, args.log_sample)
+
+    config = load_configuration(args.env)
+    plan = build_plan(config, args.cable)
+    profile = config["CAMERA_PROFILES"].get(int(args.source)) if args.source.isdigit() else None
+    aligner = None
+    if args.locate:
+        if plan.locator is None:
+            print(f"The {args.cable} profile has no connector template, calibrate its ROIs again", file=sys.stderr)
+            return 1
+        aligner = PlanAligner()
+
+    if args.parts:
+        parts = 0
+        try:
+            for record in inspect_parts(args.source, plan, profile, config, args.realtime, aligner):
+                parts += 1
+                print(json.dumps(record) if args.format == "jsonl" else format_part(record), flush=True)
+        except KeyboardInterrupt:
+            pass
+        print(f"Inspected {parts} parts", file=sys.stderr)
+        return 0
+
+    frames = 0
+    last_ok = None
+    start = time.perf_counter()
+    try:
+        for verdict in inspect_source(args.source, plan, profile, config, args.realtime, aligner):
+            frames += 1
+            if not args.changes_only or verdict["ok"] != last_ok:
+                last_ok = verdict["ok"]
+                if args.format == "jsonl":
+                    print(json.dumps(verdict), flush=True)
+                else:
+                    print(format_verdict(verdict), flush=True)
+            if args.frames is not None and frames >= args.frames:
+                break
+    except KeyboardInterrupt:
+        pass
+
+    elapsed = time.perf_counter() - start
+    if frames and elapsed > 0:
+        print(f"Inspected {frames} frames in {elapsed:.2f}s ({frames / elapsed:.1f} fps)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
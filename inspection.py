@@ -0,0 +1,384 @@
+import copy
+import json
+import os
+import re
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from colormetric import METRICS, color_lut, lut_index
+from diaglog import DEBUG, LEVELS, diagnostics
+from locator import load_locator
+from wiring import identify_wiring
+
+DEFAULT_TOLERANCE = 10  # Used when the .env does not define TOLERANCE
+DEFAULT_CAMERAS = [[0, "12pins"]]  # (camera index, cable) of every fixture of the station
+FRAME_SIZE = (640, 480)  # Size of the displayed frame, and of ROIs saved without a resolution tag
+
+TRUE_VALUES = ("1", "true", "yes")  # Spellings of an enabled on/off key, in any case
+FALSE_VALUES = ("0", "false", "no")
+FLAG_KEYS = ("CHANGE_GATE", "PRESENCE", "STABILIZE", "AUTO_LOCATE", "FRAME_BUS")  # On/off keys read at runtime
+
+# .env keys holding the expected colors, the ROIs and the (width, height) the ROIs were recorded at
+CABLES = {
+    "12pins": ("CABLE12PINS", "CABLE12ROI", "CABLE12ROI_SIZE"),
+    "16pins": ("CABLE16PINS", "CABLE16ROI", "CABLE16ROI_SIZE"),
+}
+
+
+# Function to get the .env key telling the channel order of a cable's expected colors. The
+# calibrators save colors as read from the camera (BGR), the settings form as picked (RGB).
+def color_order_key(cable):
+    return CABLES[cable][0] + "_ORDER"
+
+
+# Function to get the .env key of a cable's connector template, see locator.py
+def anchor_key(cable):
+    return CABLES[cable][1].replace("ROI", "ANCHOR")
+
+
+# Function to list every .env key a cable's compiled plan depends on
+def plan_keys(cable):
+    return CABLES[cable] + (color_order_key(cable), anchor_key(cable), "TOLERANCE", "COLOR_METRIC")
+
+
+# Function to read the cable profiles and tolerance from the .env file
+def load_configuration(path=".env"):
+    load_dotenv(path, override=True)
+    return parse_configuration(os.environ)
+
+
+# Function to parse the JSON value of a key, raises ValueError naming the key
+def _load_json(values, key, default):
+    try:
+        return json.loads(values.get(key) or default)
+    except ValueError as e:
+        raise ValueError(f"{key} is not valid JSON: {e}") from None
+
+
+# Function to tell whether a value is a list of `length` numbers
+def _is_numbers(value, length):
+    return (isinstance(value, list) and len(value) == length
+            and all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in value))
+
+
+# Function to check that a profile value is a list of [name, [numbers]] pairs, raises ValueError naming the key
+def _check_pairs(key, value, length):
+    if not isinstance(value, list) or not all(
+            isinstance(item, list) and len(item) == 2 and isinstance(item[0], str) and _is_numbers(item[1], length)
+            for item in value):
+        raise ValueError(f"{key} must be a list of [name, [{length} numbers]] pairs")
+    return value
+
+
+# Function to convert the raw .env strings into the typed configuration. Raises ValueError,
+# naming the key, for any value that does not parse or does not have the expected shape.
+def parse_configuration(values):
+    try:
+        config = {"TOLERANCE": int(values.get("TOLERANCE") or DEFAULT_TOLERANCE)}
+    except ValueError:
+        raise ValueError(f"TOLERANCE must be a whole number, not {values.get('TOLERANCE')!r}") from None
+    config["COLOR_METRIC"] = (values.get("COLOR_METRIC") or "rgb").lower()
+    if config["COLOR_METRIC"] not in METRICS:
+        raise ValueError(f"Unknown COLOR_METRIC {config['COLOR_METRIC']!r}, expected one of {', '.join(METRICS)}")
+    for cable, (pins_key, roi_key, size_key) in CABLES.items():
+        config[pins_key] = _check_pairs(pins_key, _load_json(values, pins_key, "[]"), 3)
+        config[roi_key] = _check_pairs(roi_key, _load_json(values, roi_key, "[]"), 4)
+        size = _load_json(values, size_key, json.dumps(FRAME_SIZE))
+        if not _is_numbers(size, 2) or min(size) <= 0:
+            raise ValueError(f"{size_key} must be [width, height], not {values.get(size_key)!r}")
+        config[size_key] = tuple(size)
+        # Profiles saved before the order was recorded were compared as RGB
+        order_key = color_order_key(cable)
+        config[order_key] = (values.get(order_key) or "RGB").upper()
+        if config[order_key] not in ("RGB", "BGR"):
+            raise ValueError(f"{order_key} must be RGB or BGR, not {config[order_key]!r}")
+        anchor = _load_json(values, anchor_key(cable), "null")
+        if anchor is not None and not (isinstance(anchor, dict) and isinstance(anchor.get("template"), str)
+                                       and _is_numbers(anchor.get("box"), 4)):
+            raise ValueError(f"{anchor_key(cable)} must be {{\"template\": path, \"box\": [x, y, w, h]}}")
+        config[anchor_key(cable)] = anchor
+    config["CAMERAS"] = _load_json(values, "CAMERAS", json.dumps(DEFAULT_CAMERAS))
+    if not isinstance(config["CAMERAS"], list) or not all(
+            isinstance(item, list) and len(item) == 2 and isinstance(item[0], (int, str)) for item in config["CAMERAS"]):
+        raise ValueError("CAMERAS must be a list of [camera, cable] pairs")
+    # Runtime switches, checked here so a typo is rejected with the rest of the file
+    for key in FLAG_KEYS:
+        value = values.get(key)
+        if value and value.lower() not in TRUE_VALUES + FALSE_VALUES:
+            raise ValueError(f"{key} must be one of {', '.join(TRUE_VALUES + FALSE_VALUES)}, not {value!r}")
+    try:
+        config["LOCATE_EVERY"] = int(values.get("LOCATE_EVERY") or "5")
+        if config["LOCATE_EVERY"] < 1:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"LOCATE_EVERY must be a positive number of frames, "
+                         f"not {values.get('LOCATE_EVERY')!r}") from None
+    config["LOG_LEVEL"] = (values.get("LOG_LEVEL") or "INFO").upper()
+    if config["LOG_LEVEL"] not in LEVELS:
+        raise ValueError(f"LOG_LEVEL must be one of {', '.join(LEVELS)}, not {values.get('LOG_LEVEL')!r}")
+    try:
+        config["LOG_SAMPLE_EVERY"] = int(values.get("LOG_SAMPLE_EVERY") or "1")
+        if config["LOG_SAMPLE_EVERY"] < 1:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"LOG_SAMPLE_EVERY must be a positive whole number, "
+                         f"not {values.get('LOG_SAMPLE_EVERY')!r}") from None
+    # Capture profiles saved by `python -m camera --probe`, by camera index
+    config["CAMERA_PROFILES"] = {}
+    for key, value in values.items():
+        match = re.fullmatch(r"CAMERA(\d+)_PROFILE", key)
+        if match and value:
+            profile = _load_json(values, key, "{}")
+            if not isinstance(profile, dict):
+                raise ValueError(f"{key} must be a JSON object")
+            config["CAMERA_PROFILES"][int(match.group(1))] = profile
+    for camera_index, cable in config["CAMERAS"]:
+        if cable not in CABLES:
+            raise ValueError(f"Camera {camera_index} uses unknown cable {cable!r}")
+    return config
+
+
+# Function to build the inspection plan of one cable from a loaded configuration
+def build_plan(config, cable):
+    pins_key, roi_key, size_key = CABLES[cable]
+    return InspectionPlan(config[pins_key], config[roi_key], config["TOLERANCE"], config[size_key],
+                          config["COLOR_METRIC"], config[color_order_key(cable)], config[anchor_key(cable)])
+
+
+# Function to map ROIs recorded at one (width, height) to another, returns an (N, 4) int array
+def scale_rois(rois, from_size, to_size):
+    scale_x = to_size[0] / from_size[0]
+    scale_y = to_size[1] / from_size[1]
+    rois = np.asarray(rois, dtype=np.float64).reshape(-1, 4)
+    x0 = np.rint(rois[:, 0] * scale_x)
+    y0 = np.rint(rois[:, 1] * scale_y)
+    x1 = np.rint((rois[:, 0] + rois[:, 2]) * scale_x)
+    y1 = np.rint((rois[:, 1] + rois[:, 3]) * scale_y)
+    return np.stack((x0, y0, x1 - x0, y1 - y0), axis=1).astype(np.int32)
+
+
+# Function to convert a camera frame into the RGB frame that is displayed
+def prepare_frame(frame):
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return cv2.resize(frame, FRAME_SIZE)
+
+
+# Function to get the dominant color in an ROI
+def get_dominant_color(frame, roi):
+    x, y, w, h = roi
+    roi_frame = frame[y:y+h, x:x+w]  # Extract the ROI
+    avg_color = np.mean(roi_frame, axis=(0, 1)).astype(np.uint8)  # Calculate the average color
+    return avg_color  # Returns [B, G, R]
+
+
+# Function to check if a color is within tolerance range
+def detect_color(frame, expected_color, roi, tolerance=DEFAULT_TOLERANCE):
+    dominant_color = get_dominant_color(frame, roi)
+    if diagnostics.enabled(DEBUG):
+        diagnostics.log(DEBUG, "detect_color", expected=list(expected_color), dominant=dominant_color.tolist())
+
+    # Convert to NumPy arrays for easier computation
+    dominant_color = np.array(dominant_color, dtype=np.int16)
+    expected_color = np.array(expected_color, dtype=np.int16)
+
+    # Compute absolute difference per channel (B, G, R)
+    diff = np.abs(dominant_color - expected_color)
+
+    # Check if all channels are within tolerance range
+    return np.all(diff <= tolerance)
+
+
+class InspectionPlan:
+    """A cable profile compiled into arrays so every pin is checked in one pass.
+
+    `colors` and `rois` use the .env layout: [[pin_name, [c0, c1, c2]], ...]
+    and [[pin_name, [x, y, w, h]], ...]. Pins without a matching ROI are
+    ignored, the same way update_frame() always skipped them.
+
+    The ROIs are coordinates on a frame of `roi_size` (width, height) and are
+    mapped onto whatever frame is inspected, so the raw camera frame can be
+    evaluated directly without resizing it first.
+
+    `metric` selects how colors are compared, see colormetric.py, and
+    `order` tells whether the expected colors were saved as RGB or BGR.
+    `anchor` is the connector template saved with the ROIs, see locator.py.
+    """
+
+    def __init__(self, colors, rois, tolerance, roi_size=FRAME_SIZE, metric="rgb", order="RGB", anchor=None):
+        count = min(len(colors), len(rois))
+        self.names = [pin_name for pin_name, _ in colors[:count]]
+        self.rois = np.array([roi for _, roi in rois[:count]], dtype=np.int32).reshape(count, 4)
+        self.roi_size = tuple(roi_size)
+        self.expected = np.array([color for _, color in colors[:count]], dtype=np.int16).reshape(count, 3)
+        if order == "BGR":
+            self.expected = self.expected[:, ::-1].copy()  # Kept in RGB order like the legacy comparison
+        # Tolerance can be a single value or one value per pin and channel
+        self.tolerances = np.broadcast_to(np.asarray(tolerance, dtype=np.int16), (count, 3)).copy()
+        self.pin_tolerances = self.tolerances.max(axis=1)  # One value per pin, to compare with the distances
+        # Distance table of the perceptual metrics, shared by every plan with the same colors
+        self.metric = metric
+        self.lut = color_lut(metric, self.expected) if metric != "rgb" and count else None
+        self._pins = np.arange(count)
+        # Change of an ROI mean, in levels, the ChangeGate may ignore: half the tightest tolerance, as a
+        # mean that moves less can only flip a pin sitting at its limit. Hue distances swing far more than the
+        # levels on dull colors, so the hue metric keeps a small fixed threshold.
+        tightest = int(self.tolerances.min()) if count else DEFAULT_TOLERANCE
+        self.gate_threshold = 4 if metric == "hue" else max(tightest // 2, 2)
+        self.locator = load_locator(anchor, self.roi_size) if count else None
+
+        # ROI slices, compiled lazily for the frame shape being inspected
+        self._shape = None
+        self._regions = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def scaled_rois(self, size):
+        """ROIs mapped onto a frame of the given (width, height)"""
+        if tuple(size) == self.roi_size:
+            return self.rois
+        return scale_rois(self.rois, self.roi_size, size)
+
+    def shifted(self, dx, dy):
+        """Copy of the plan with every ROI moved by (dx, dy) pixels of roi_size, sharing everything else"""
+        plan = copy.copy(self)
+        plan.rois = self.rois + np.array([dx, dy, 0, 0], dtype=np.int32)
+        plan._shape = None
+        plan._regions = None
+        return plan
+
+    def _compile(self, shape):
+        # Precompute the clipped (rows, columns) slices of every ROI, None for ROIs outside the frame
+        height, width = shape[:2]
+        self._regions = []
+        for x, y, w, h in self.scaled_rois((width, height)).tolist():
+            x0, x1 = max(x, 0), min(x + w, width)
+            y0, y1 = max(y, 0), min(y + h, height)
+            self._regions.append((slice(y0, y1), slice(x0, x1)) if x1 > x0 and y1 > y0 else None)
+        self._shape = shape
+
+    def dominant_colors(self, frame):
+        """Average color of every ROI as an (N, 3) array, in the frame's channel order"""
+        if frame.shape != self._shape:
+            self._compile(frame.shape)
+        # cv2.mean reads each ROI in place, this is much cheaper than gathering
+        # every ROI pixel into one array once ROIs are scaled up to the camera frame
+        means = np.zeros((len(self), 3))
+        for i, region in enumerate(self._regions):
+            if region is not None:
+                means[i] = cv2.mean(frame[region])[:3]
+        return np.floor(means)  # Truncate like np.mean(...).astype(np.uint8)
+
+    def evaluate(self, frame, bgr=False):
+        """Check all pins at once.
+
+        `frame` is an RGB frame of any size, or with `bgr=True` the camera frame
+        as captured. Returns a boolean vector telling which pins are within
+        tolerance, and the distance of each pin to its expected color: the
+        largest per-channel difference for the rgb metric, otherwise the
+        metric's distance looked up in the table.
+        """
+        return self.compare(self.dominant_colors(frame), bgr)
+
+    def compare(self, dominant, bgr=False):
+        """Check the ROI means of dominant_colors() against the expected colors, like evaluate()"""
+        if self.lut is not None:
+            if not bgr:
+                dominant = dominant[:, ::-1]  # The table is indexed by BGR colors
+            distances = self.lut[lut_index(dominant), self._pins]
+            return distances <= self.pin_tolerances, distances
+        if bgr:
+            dominant = dominant[:, ::-1]  # Expected colors are compared in RGB order
+        diff = np.abs(dominant - self.expected)
+        matches = np.all(diff <= self.tolerances, axis=1)
+        return matches, diff.max(axis=1, initial=0)
+
+    def distance_matrix(self, dominant, bgr=False):
+        """Distance of every ROI mean (rows) to every expected color (columns), in the units of evaluate()"""
+        if self.lut is not None:
+            if not bgr:
+                dominant = dominant[:, ::-1]
+            return self.lut[lut_index(dominant)]  # Each table row already holds every pin
+        if bgr:
+            dominant = dominant[:, ::-1]
+        return np.abs(dominant[:, np.newaxis, :] - self.expected[np.newaxis, :, :]).max(axis=2)
+
+    def identify(self, dominant, matches, bgr=False):
+        """Which pin's wire every ROI holds, see wiring.identify_wiring()"""
+        return identify_wiring(self.distance_matrix(dominant, bgr), self.pin_tolerances, matches)
+
+
+class ChangeGate:
+    """Tells whether a frame differs enough from the last inspected one to inspect it again.
+
+    Every ROI of the plan passed as `key` is sampled on a `samples` x
+    `samples` grid of pixels, and the frame counts as changed as soon as the
+    mean of any ROI moved by more than the plan's `gate_threshold` on any
+    channel, or `threshold` when that is lower. A wire that changed color
+    in a single pin is never missed, whatever the size of its ROI. As an
+    extra trigger, each frame is also sampled down to a `size` thumbnail with
+    nearest-neighbour resizing, and counts as changed when more than
+    `fraction` of its samples moved by more than that threshold. Both read a
+    few thousand pixels whatever the resolution, and are compared with the
+    last frame that was inspected rather than the previous one, so slow
+    drift adds up until it triggers. A new plan, or `max_age` frames in a
+    row without a change, always triggers so a verdict is never older than that.
+    """
+
+    def __init__(self, threshold=24, fraction=0.002, max_age=30, size=(80, 60), samples=4):
+        self.threshold = threshold
+        self.fraction = fraction
+        self.max_age = max_age
+        self.size = size
+        self.samples = samples
+        self.thumbnail = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.reference = np.empty_like(self.thumbnail)
+        self.diff = np.empty_like(self.thumbnail)
+        self.key = None  # Plan the reference was inspected with
+        self.age = 0  # Frames skipped since the reference
+        self._points_key = None  # (plan, frame shape) the sample points were compiled for
+        self._points = None  # (ys, xs) index arrays of the ROI samples, None without ROIs
+        self.means = None  # Mean color of every ROI of the last frame
+        self.reference_means = None
+
+    def _compile(self, key, shape):
+        # Pixel centers of a samples x samples grid in every ROI, at the frame's resolution
+        height, width = shape[:2]
+        rois = key.scaled_rois((width, height)).astype(np.float64) if len(key) else None
+        if rois is None:
+            return None
+        steps = (np.arange(self.samples) + 0.5) / self.samples
+        xs = np.clip((rois[:, 0:1] + rois[:, 2:3] * steps).astype(np.intp), 0, width - 1)
+        ys = np.clip((rois[:, 1:2] + rois[:, 3:4] * steps).astype(np.intp), 0, height - 1)
+        return ys[:, :, np.newaxis], xs[:, np.newaxis, :]
+
+    def changed(self, frame, key=None):
+        """Return True when `frame` must be inspected, it then becomes the new reference"""
+        if frame.ndim != 3 or frame.shape[2] != 3:
+            return True
+        if hasattr(key, "scaled_rois"):
+            if (key, frame.shape) != self._points_key:
+                self._points = self._compile(key, frame.shape)
+                self._points_key = (key, frame.shape)
+            self.means = None if self._points is None else frame[self._points].mean(axis=(1, 2))
+        else:
+            self.means = None
+        cv2.resize(frame, self.size, dst=self.thumbnail, interpolation=cv2.INTER_NEAREST)
+        if key is self.key and self.age < self.max_age:
+            threshold = min(self.threshold, getattr(key, "gate_threshold", self.threshold))
+            cv2.absdiff(self.thumbnail, self.reference, dst=self.diff)
+            roi_moved = self.means is not None and bool((np.abs(self.means - self.reference_means) > threshold).any())
+            if not roi_moved and np.count_nonzero(self.diff > threshold) <= self.fraction * self.diff.size:
+                self.age += 1
+                return False
+        self.thumbnail, self.reference = self.reference, self.thumbnail
+        self.reference_means = self.means
+        self.key = key
+        self.age = 0
+        return True
+
+    def reset(self):
+        """Inspect the next frame whatever it shows"""
+        self.key = None
@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-size float buffer that keeps the most recent values"""
+
+    def __init__(self, size):
+        self.values = np.zeros(size)
+        self.count = 0  # Total values ever appended
+
+    def append(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def snapshot(self):
+        """Return the stored values, oldest first"""
+        size = len(self.values)
+        if self.count <= size:
+            return self.values[:self.count].copy()
+        start = self.count % size
+        return np.concatenate((self.values[start:], self.values[:start]))
+
+
+class LatencyStats:
+    """Rolling per-stage latencies and per-stream frame rates.
+
+    Stages are timed with `time(name)` or `record(name, seconds)` from any
+    thread. Streams (capture, detection, display) call `tick(name)` once per
+    frame to measure their effective FPS. Memory stays constant because every
+    stage and stream keeps its last `size` values in a ring buffer.
+    """
+
+    def __init__(self, size=512):
+        self.size = size
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._ticks = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            if stage not in self._stages:
+                self._stages[stage] = RingBuffer(self.size)
+            self._stages[stage].append(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Time the body of a with block as one sample of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def tick(self, stream):
+        """Mark one frame of a stream as done"""
+        with self._lock:
+            if stream not in self._ticks:
+                self._ticks[stream] = RingBuffer(self.size)
+            self._ticks[stream].append(time.perf_counter())
+
+    def summary(self):
+        """Percentiles in milliseconds per stage and effective FPS per stream"""
+        with self._lock:
+            stages = {name: buffer.snapshot() for name, buffer in self._stages.items()}
+            ticks = {name: buffer.snapshot() for name, buffer in self._ticks.items()}
+
+        result = {"stages": {}, "fps": {}}
+        for name, samples in stages.items():
+            if samples.size:
+                p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+                result["stages"][name] = {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "samples": int(samples.size)}
+        for name, times in ticks.items():
+            if times.size > 1 and times[-1] > times[0]:
+                result["fps"][name] = (times.size - 1) / (times[-1] - times[0])
+        return result
+
+    def format_status(self):
+        """One line summary for the status bar"""
+        summary = self.summary()
+        parts = [f"{name} {fps:.1f} fps" for name, fps in summary["fps"].items()]
+        parts += [f"{name} {stats['p50_ms']:.1f}/{stats['p95_ms']:.1f}/{stats['p99_ms']:.1f} ms"
+                  for name, stats in summary["stages"].items()]
+        return " | ".join(parts)
+
+    def dump(self, path):
+        """Write the current summary to a JSON file"""
+        summary = self.summary()
+        summary["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with open(path, "w") as output:
+            json.dump(summary, output, indent=2, default=float)
+
+
+class ScopedStats:
+    """View of a LatencyStats that prefixes every stage and stream name.
+
+    Lets several pipelines share one LatencyStats, e.g. "cam1 roi" and
+    "cam1 capture" next to "cam0 roi" and "cam0 capture".
+    """
+
+    def __init__(self, stats, prefix):
+        self.stats = stats
+        self.prefix = prefix
+
+    def record(self, stage, seconds):
+        self.stats.record(self.prefix + stage, seconds)
+
+    def time(self, stage):
+        return self.stats.time(self.prefix + stage)
+
+    def tick(self, stream):
+        self.stats.tick(self.prefix + stream)
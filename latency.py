@@ -0,0 +1,248 @@
+"""Measure the glass-to-verdict latency of the inspection pipeline.
+
+A scripted synthetic feed alternates between a mis-wired cable (every pin
+shows the color of its neighbour) and the correctly wired one, using the
+CABLE12PINS layout by default. It runs through the same CameraSession and
+Pipeline as the main window, with the render work of a station minus the
+Tk calls, polled every 10 ms like update_frame().
+
+With `--glitch N` every Nth frame of the correct phase shows the wrong
+cable for that one frame, like a hand shadow or an exposure step, which
+the verdict stabilizer is expected to ride out.
+
+Every frame carries its number in its last pixel row and is timestamped
+when the source delivers it. Every verdict is timestamped when the render
+loop picks it up. The report holds the latency of each verdict and, for
+each wrong -> correct step, the time and the number of frames until the
+verdict turned OK and stayed OK.
+
+Example:
+    python -m latency --cable 12pins --fps 30 --step 30 --cycles 10 --output latency.json
+    python -m latency --glitch 7 --no-stabilize
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from benchmark import render_offscreen
+from inspection import CABLES, FRAME_SIZE, build_plan, color_order_key, load_configuration
+from instrumentation import LatencyStats
+from pipeline import CameraSession, Inspector, Pipeline
+from sources import Pacer, make_synthetic_frame
+
+POLL_INTERVAL = 0.01  # Same as the update_frame() loop of the main window
+STAMP_SIZE = 8  # Pixels of the last row that hold the frame number
+
+
+# Function to write a frame number into the last pixel row of a frame, away from the ROIs
+def stamp_frame(frame, frame_id):
+    frame[-1, :STAMP_SIZE, 0] = np.frombuffer(np.int64(frame_id).tobytes(), dtype=np.uint8)
+
+
+# Function to read back the frame number written by stamp_frame()
+def read_stamp(frame):
+    return int(np.frombuffer(frame[-1, :STAMP_SIZE, 0].tobytes(), dtype=np.int64)[0])
+
+
+class StepSource:
+    """Synthetic source that switches from wrong to correct colors every `step` frames.
+
+    Frames [0, step) of each cycle show the mis-wired cable, frames
+    [step, 2 * step) the correct one, except every `glitch`th frame of the
+    correct phase which shows the wrong cable. `times` holds the moment each
+    frame was delivered, in time.perf_counter() seconds.
+    """
+
+    def __init__(self, config, cable, step=30, cycles=5, size=FRAME_SIZE, fps=30.0, glitch=None):
+        pins_key, roi_key, size_key = CABLES[cable]
+        colors = config[pins_key]
+        # Every pin gets the color of the next one, so the whole cable is wired wrong
+        wrong = [[pin_name, colors[(i + 1) % len(colors)][1]] for i, (pin_name, _) in enumerate(colors)]
+        order = config[color_order_key(cable)]
+        self.wrong = make_synthetic_frame(wrong, config[roi_key], config[size_key], size, order=order)
+        self.correct = make_synthetic_frame(colors, config[roi_key], config[size_key], size, order=order)
+        self.step = step
+        self.glitch = glitch
+        self.length = 2 * step * cycles
+        self.pacer = Pacer(fps)
+        self.times = np.full(self.length, np.nan)
+        self.frame_id = -1
+
+    def is_correct(self, frame_id):
+        return frame_id % (2 * self.step) >= self.step
+
+    @property
+    def done(self):
+        return self.frame_id + 1 >= self.length
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        if self.done:
+            return False, None
+        self.pacer.wait()
+        frame_id = self.frame_id + 1
+        glitch = self.glitch and (frame_id % (2 * self.step) - self.step) % self.glitch == self.glitch - 1
+        template = self.correct if self.is_correct(frame_id) and not glitch else self.wrong
+        frame = image if image is not None and image.shape == template.shape else np.empty_like(template)
+        np.copyto(frame, template)
+        stamp_frame(frame, frame_id)
+        self.times[frame_id] = time.perf_counter()
+        self.frame_id = frame_id
+        return True, frame
+
+    def release(self):
+        pass
+
+
+# Function to run a step sequence through the pipeline, returns the source and the
+# (frame_id, emitted_time, ok) verdicts in the order they were emitted
+def run_sequence(config, cable, step, cycles, size, fps, glitch=None, stabilize=True, drain=0.5):
+    source = StepSource(config, cable, step, cycles, size, fps, glitch)
+    plan = build_plan(config, cable)
+    display_buffer = np.empty((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+
+    # The same inspector as the stations, so the gate and the stabilizer are part of the measured latency
+    inspector = Inspector(LatencyStats())
+    inspector.plan = plan
+    inspector.stabilize_enabled = stabilize
+
+    def inspect(frame):
+        frame, pins, matches, _ = inspector.inspect(frame)
+        return frame, pins, read_stamp(frame), bool(matches.all())
+
+    session = CameraSession(source)
+    pipeline = Pipeline(session, inspect)
+    verdicts = []
+    pipeline.start()
+    session.start()
+    try:
+        idle_since = None
+        while True:
+            result = pipeline.results.get_nowait()
+            if result is None:
+                # Stop once the source ran out and the pipeline has nothing left in flight
+                if source.done:
+                    idle_since = idle_since or time.perf_counter()
+                    if time.perf_counter() - idle_since > drain:
+                        break
+                time.sleep(POLL_INTERVAL)
+                continue
+            idle_since = None
+            raw, pins, frame_id, ok = result
+            render_offscreen(pipeline, raw, pins, display_buffer)
+            verdicts.append((frame_id, time.perf_counter(), ok))
+    finally:
+        pipeline.stop()
+        session.close()
+    return source, verdicts
+
+
+# Function to summarize latencies in milliseconds
+def distribution(samples):
+    samples = np.asarray([sample for sample in samples if sample is not None], dtype=float) * 1000
+    if not samples.size:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"count": int(samples.size), "mean_ms": float(samples.mean()), "p50_ms": float(p50),
+            "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(samples.max())}
+
+
+# Function to measure every wrong -> correct step of a run: the first OK verdict and
+# the verdict from which it stayed OK until the cable was pulled again
+def analyze_steps(source, verdicts):
+    steps = []
+    cycle_length = 2 * source.step
+    for seated in range(source.step, source.length, cycle_length):
+        pulled = seated + source.step
+        window = [(frame_id, emitted, ok) for frame_id, emitted, ok in verdicts if seated <= frame_id < pulled]
+        first_ok = next((item for item in window if item[2]), None)
+        stable = None
+        for item in reversed(window):
+            if not item[2]:
+                break
+            stable = item
+        glass = source.times[seated]
+        steps.append({
+            "seated_frame": seated,
+            "first_ok_ms": (first_ok[1] - glass) * 1000 if first_ok else None,
+            "stable_ms": (stable[1] - glass) * 1000 if stable else None,
+            "frames_to_stable": stable[0] - seated if stable else None,
+            "verdicts": len(window),
+        })
+    return steps
+
+
+# Function to build the report of a run
+def analyze(source, verdicts):
+    latencies = [emitted - source.times[frame_id] for frame_id, emitted, _ in verdicts]
+    wrong = [ok for frame_id, _, ok in verdicts if not source.is_correct(frame_id)]
+    steps = analyze_steps(source, verdicts)
+    frames_to_stable = [step["frames_to_stable"] for step in steps if step["frames_to_stable"] is not None]
+    return {
+        "frames": source.frame_id + 1,
+        "verdicts": len(verdicts),
+        "dropped": source.frame_id + 1 - len(verdicts),
+        # Wired-wrong frames judged OK: the stabilizer holds an OK for a frame after the cable is
+        # pulled, more than that means the scripted sequence does not exercise the step
+        "false_ok": int(sum(wrong)),
+        "verdict_latency": distribution(latencies),
+        "step_first_ok": distribution([step["first_ok_ms"] / 1000 for step in steps if step["first_ok_ms"] is not None]),
+        "step_stable": distribution([step["stable_ms"] / 1000 for step in steps if step["stable_ms"] is not None]),
+        "frames_to_stable": {
+            "max": max(frames_to_stable) if frames_to_stable else None,
+            "mean": float(np.mean(frames_to_stable)) if frames_to_stable else None,
+            "never_stable": len(steps) - len(frames_to_stable),
+        },
+        "steps": steps,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the glass-to-verdict latency of the inspection pipeline")
+    parser.add_argument("--env", default=".env", help="configuration file with the cable profiles")
+    parser.add_argument("--cable", default="12pins", choices=sorted(CABLES), help="cable profile to script")
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate of the scripted source")
+    parser.add_argument("--step", type=int, default=30, help="frames the cable stays wrong, then correct")
+    parser.add_argument("--cycles", type=int, default=5, help="wrong -> correct steps to measure")
+    parser.add_argument("--size", default="640x480", help="frame size as WIDTHxHEIGHT")
+    parser.add_argument("--glitch", type=int, help="show the wrong cable on every Nth frame of the correct phase")
+    parser.add_argument("--no-stabilize", action="store_true", help="use the verdict of every single frame")
+    parser.add_argument("--output", help="JSON file to write the report to")
+    args = parser.parse_args(argv)
+
+    config = load_configuration(args.env)
+    if not len(build_plan(config, args.cable)):
+        print(f"The {args.cable} profile has no pins with an ROI", file=sys.stderr)
+        return 1
+    size = tuple(int(value) for value in args.size.split("x"))
+    source, verdicts = run_sequence(config, args.cable, args.step, args.cycles, size, args.fps,
+                                    args.glitch, not args.no_stabilize)
+    report = analyze(source, verdicts)
+
+    latency = report["verdict_latency"]
+    stable = report["step_stable"]
+    print(f"{report['frames']} frames, {report['verdicts']} verdicts, {report['dropped']} dropped, "
+          f"{report['false_ok']} false OK", file=sys.stderr)
+    if latency["count"]:
+        print(f"verdict latency  p50 {latency['p50_ms']:.1f} ms  p95 {latency['p95_ms']:.1f} ms  "
+              f"max {latency['max_ms']:.1f} ms", file=sys.stderr)
+    if stable["count"]:
+        print(f"seated -> stable OK  p50 {stable['p50_ms']:.1f} ms  p95 {stable['p95_ms']:.1f} ms  "
+              f"max {stable['max_ms']:.1f} ms, up to {report['frames_to_stable']['max']} frames", file=sys.stderr)
+    if report["frames_to_stable"]["never_stable"]:
+        print(f"{report['frames_to_stable']['never_stable']} steps never reached a stable OK", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"Report written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Automatic connector localization.
+
+When the ROIs are calibrated, a grayscale template of the connector (the
+bounding box of every ROI plus a margin) is saved next to the .env and
+recorded as CABLE12ANCHOR / CABLE16ANCHOR with the box it was cut from.
+With AUTO_LOCATE='1' each station searches for that template every
+LOCATE_EVERY frames and moves all ROIs with the connector, so a fixture
+that was bumped keeps being inspected without recalibrating.
+
+The search is coarse to fine: the whole frame is only searched at the top
+of an image pyramid, a few thousand pixels, and every finer level only
+refines the position within a couple of pixels. A connector pushed partly
+out of the frame counts as not found, rather than being matched where the
+template still fits. Only translation is followed; a connector that is
+rotated or moved closer to the camera still needs a new calibration.
+"""
+import cv2
+import numpy as np
+
+from diaglog import WARNING, diagnostics
+
+MARGIN = 0.25  # Part of the ROI bounding box added on every side of the template
+MAX_TEMPLATE = 0.8  # Largest template side as a part of the frame's, so it can still be found when it moved
+MIN_TEMPLATE = 16  # Smallest template side in pixels at the top of the pyramid
+PATCH = 64  # Side of the template patch that refines the position on the finer levels
+
+
+# Function to cut the grayscale connector template out of a frame, returns it with its (x, y, w, h)
+# box. `rois` are (x, y, w, h) at the frame's resolution.
+def cut_template(frame, rois):
+    height, width = frame.shape[:2]
+    rois = np.asarray(rois, dtype=np.int32).reshape(-1, 4)
+    x0, y0 = rois[:, 0].min(), rois[:, 1].min()
+    x1, y1 = (rois[:, 0] + rois[:, 2]).max(), (rois[:, 1] + rois[:, 3]).max()
+    pad_x, pad_y = int((x1 - x0) * MARGIN), int((y1 - y0) * MARGIN)
+    x0, y0 = max(int(x0) - pad_x, 0), max(int(y0) - pad_y, 0)
+    x1, y1 = min(int(x1) + pad_x, width), min(int(y1) + pad_y, height)
+    # ROIs spread over most of the frame leave no room to move, keep the middle of them
+    trim_x, trim_y = max(x1 - x0 - int(width * MAX_TEMPLATE), 0), max(y1 - y0 - int(height * MAX_TEMPLATE), 0)
+    x0, x1 = x0 + trim_x // 2, x1 - (trim_x - trim_x // 2)
+    y0, y1 = y0 + trim_y // 2, y1 - (trim_y - trim_y // 2)
+    return cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY), [x0, y0, x1 - x0, y1 - y0]
+
+
+# Function to save the connector template of a calibration frame, returns the anchor to store in the .env
+def save_anchor(frame, rois, path):
+    template, box = cut_template(frame, rois)
+    cv2.imwrite(path, template)
+    return {"template": path, "box": box}
+
+
+# Function to load the locator of a saved anchor, None when there is none or its template is missing
+def load_locator(anchor, roi_size):
+    if not anchor:
+        return None
+    template = cv2.imread(anchor["template"], cv2.IMREAD_GRAYSCALE)
+    if template is None:
+        diagnostics.log(WARNING, "anchor_missing", template=anchor["template"])
+        return None
+    return ConnectorLocator(template, anchor["box"], roi_size)
+
+
+class ConnectorLocator:
+    """Finds a connector template in camera frames with coarse-to-fine template matching.
+
+    `template` is the grayscale connector cut at `box` (x, y, w, h) from a
+    frame of `roi_size`. Frames of any resolution can be searched, the
+    template is scaled to them once per frame size.
+    """
+
+    def __init__(self, template, box, roi_size, levels=3, min_score=0.75, refine=2):
+        self.template = template
+        self.box = tuple(box)
+        self.roi_size = tuple(roi_size)
+        self.levels = levels
+        self.min_score = min_score
+        self.refine = refine  # Pixels searched around the position found one level up
+        self._shape = None
+        self._templates = None  # Template pyramid for the frame size being searched, finest first
+        self._patches = None  # (patch, x, y) of every level but the top, the most detailed part of the template
+        self._scale = None
+
+    def _compile(self, shape):
+        height, width = shape[:2]
+        self._scale = (width / self.roi_size[0], height / self.roi_size[1])
+        template = self.template
+        if self._scale != (1.0, 1.0):
+            size = (max(int(round(template.shape[1] * self._scale[0])), 1),
+                    max(int(round(template.shape[0] * self._scale[1])), 1))
+            template = cv2.resize(template, size, interpolation=cv2.INTER_AREA)
+        self._templates = [template]
+        while len(self._templates) <= self.levels and min(self._templates[-1].shape) >= 2 * MIN_TEMPLATE:
+            self._templates.append(cv2.pyrDown(self._templates[-1]))
+        self._patches = [_detailed_patch(template) for template in self._templates[:-1]]
+        self._shape = shape
+
+    def locate(self, frame):
+        """Return the (dx, dy) shift of the connector from its calibrated position in roi_size
+        pixels and the match score, or None when it is not found with at least min_score"""
+        if frame.shape != self._shape:
+            self._compile(frame.shape)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        pyramid = [gray]
+        for _ in range(len(self._templates) - 1):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        if any(image.shape[0] < template.shape[0] or image.shape[1] < template.shape[1]
+               for image, template in zip(pyramid, self._templates)):
+            return None
+
+        # Search the whole top level, it is a few thousand pixels. Its score of the whole
+        # template tells whether the connector is there, a patch alone matches too easily.
+        # The level is padded so a connector pushed past the edge of the frame is found
+        # there, instead of at the nearest position where the template still fits.
+        top, template = pyramid[-1], self._templates[-1]
+        pad_y, pad_x = template.shape[0] // 4, template.shape[1] // 4
+        padded = cv2.copyMakeBorder(top, pad_y, pad_y, pad_x, pad_x, cv2.BORDER_CONSTANT, value=0)
+        result = cv2.matchTemplate(padded, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv2.minMaxLoc(result)
+        if score < self.min_score:
+            return None
+        # Partly out of the frame, some ROIs would have no pixels to read
+        position = _inside(top, template, x - pad_x, y - pad_y, slack=1)
+        if position is None:
+            return None
+        x, y = position
+
+        # Refine within a few pixels of twice the position on every finer level. Matching a
+        # small patch of the template there is enough and keeps the cost independent of its size.
+        for level, image, template, (patch, px, py) in zip(range(len(pyramid) - 2, -1, -1), reversed(pyramid[:-1]),
+                                                           reversed(self._templates[:-1]), reversed(self._patches)):
+            ph, pw = patch.shape
+            x0 = min(max(2 * x + px - self.refine, 0), image.shape[1] - pw)
+            y0 = min(max(2 * y + py - self.refine, 0), image.shape[0] - ph)
+            x1 = min(2 * x + px + self.refine + pw, image.shape[1])
+            y1 = min(2 * y + py + self.refine + ph, image.shape[0])
+            result = cv2.matchTemplate(image[y0:y1, x0:x1], patch, cv2.TM_CCOEFF_NORMED)
+            _, _, _, (x, y) = cv2.minMaxLoc(result)
+            # A position where the template no longer fits is not trustworthy
+            position = _inside(image, template, x + x0 - px, y + y0 - py, slack=1 if level else 0)
+            if position is None:
+                return None
+            x, y = position
+
+        dx = int(round(x / self._scale[0])) - self.box[0]
+        dy = int(round(y / self._scale[1])) - self.box[1]
+        return dx, dy, score
+
+
+# Function to check that a template fits an image at (x, y), returns the position clamped to the image
+# or None when it is more than `slack` pixels out, the rounding of the pyramid levels
+def _inside(image, template, x, y, slack=0):
+    max_x, max_y = image.shape[1] - template.shape[1], image.shape[0] - template.shape[0]
+    if not (-slack <= x <= max_x + slack and -slack <= y <= max_y + slack):
+        return None
+    return min(max(x, 0), max_x), min(max(y, 0), max_y)
+
+
+# Function to find the PATCH x PATCH part of a template with the most edges, returns (patch, x, y)
+def _detailed_patch(template):
+    th, tw = template.shape
+    pw, ph = min(PATCH, tw), min(PATCH, th)
+    edges = np.abs(cv2.Sobel(template, cv2.CV_32F, 1, 0)) + np.abs(cv2.Sobel(template, cv2.CV_32F, 0, 1))
+    energy = cv2.boxFilter(edges, -1, (pw, ph), anchor=(0, 0), normalize=False)[:th - ph + 1, :tw - pw + 1]
+    y, x = np.unravel_index(int(energy.argmax()), energy.shape)
+    return template[y:y + ph, x:x + pw].copy(), int(x), int(y)
+
+
+class PlanAligner:
+    """Keeps a plan's ROIs on its connector, searching for it every `every` frames.
+
+    Between searches, or when the connector is not found (a hand covers it,
+    no cable is seated), the last position found is kept. The ROIs only
+    move when the connector moved by at least `min_shift` pixels.
+    """
+
+    def __init__(self, every=5, min_shift=1):
+        self.every = every
+        self.min_shift = min_shift
+        self.reset()
+
+    def reset(self):
+        """Search on the next frame and start from the calibrated position"""
+        self.base = None  # Plan the offset belongs to
+        self.aligned = None
+        self.offset = (0, 0)
+        self.score = None  # Score of the last search, None when the connector was not found
+        self._countdown = 0
+
+    def align(self, frame, plan):
+        """Return `plan`, or a copy of it with its ROIs moved onto the connector"""
+        if plan.locator is None:
+            return plan
+        if plan is not self.base:
+            self.reset()
+            self.base = self.aligned = plan
+        self._countdown -= 1
+        if self._countdown <= 0:
+            self._countdown = self.every
+            found = plan.locator.locate(frame)
+            self.score = None if found is None else found[2]
+            if found is not None:
+                dx, dy, _ = found
+                if max(abs(dx - self.offset[0]), abs(dy - self.offset[1])) >= self.min_shift:
+                    self.offset = (dx, dy)
+                    self.aligned = plan.shifted(dx, dy)
+        return self.aligned
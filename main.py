@@ -1,118 +1,130 @@
-import cv2
 import tkinter as tk
 import sys
-from tkinter import ttk
 from PIL import Image, ImageTk
-import numpy as np
 import threading
-import os
 import json
-from dotenv import load_dotenv
 import shutil
 import subprocess
 from tkinter import filedialog, messagebox
 
 from settings import SettingsForm
+from station import InspectionStation
+from pipeline import CameraSession
+from framebus import BusSession, module_command, run_module_command
+from config_store import ConfigStore, ConfigWatcher, write_config_file
+from instrumentation import LatencyStats, ScopedStats
+from diaglog import diagnostics
+
+# The frozen exe also runs the frame bus and the calibrators in child processes, see framebus.module_command()
+if run_module_command(sys.argv):
+    sys.exit()
 
 # Global variables
-cap = None
-current_colors = []
-current_roi = []
-CABLE12PINS = []
-CABLE12ROI = []
-CABLE16PINS = []
-CABLE16ROI = []
-color_labels = []
+stations = []  # One InspectionStation per camera of the CAMERAS setting
+config_store = ConfigStore(".env")
+applied_config_version = 0  # Snapshot version the labels were built from
 camera_running = True
-TOLERANCE = 10  # Default tolerance in case .env is not loaded properly
+latency_stats = LatencyStats()
 
 
 def reload_configuration():
-    # Reloads configuration from .env and updates global variables.
-    global current_colors, current_roi, TOLERANCE, CABLE12PINS, CABLE12ROI, CABLE16PINS, CABLE16ROI
-
-    # Reload environment variables
-    load_dotenv(override=True)
-
-    # Read from .env
-    cable12pins_str = os.getenv("CABLE12PINS", "[]")
-    cable12roi_str = os.getenv("CABLE12ROI", "[]")
-    cable16pins_str = os.getenv("CABLE16PINS", "[]")
-    cable16roi_str = os.getenv("CABLE16ROI", "[]")
-    TOLERANCE = int(os.getenv("TOLERANCE", "10"))  # Default to 10 if not found
-
-    # Convert JSON strings to Python lists
-    CABLE12PINS = json.loads(cable12pins_str)
-    CABLE12ROI = json.loads(cable12roi_str)
-    CABLE16PINS = json.loads(cable16pins_str)
-    CABLE16ROI = json.loads(cable16roi_str)
-
-    print("Configuration reloaded successfully!")
-
-    # Update the UI with new color labels
-    update_color_list("12pins")  # Default to 12-pin mode after reloading
-
-# Function to get the dominant color in an ROI
-def get_dominant_color(frame, roi):
-    x, y, w, h = roi
-    roi_frame = frame[y:y+h, x:x+w]  # Extract the ROI
-    avg_color = np.mean(roi_frame, axis=(0, 1)).astype(np.uint8)  # Calculate the average color
-    return avg_color  # Returns [B, G, R]
-
-
-# Function to check if a color is within tolerance range
-def detect_color(frame, expected_color, roi):
-    global TOLERANCE
-    dominant_color = get_dominant_color(frame, roi)
-    print("expected color: ", expected_color)
-    print("dominant_color: ", dominant_color)
-
-    # Convert to NumPy arrays for easier computation
-    dominant_color = np.array(dominant_color, dtype=np.int16)
-    expected_color = np.array(expected_color, dtype=np.int16)
+    # Reloads the .env if it changed and swaps the new profile of every station in.
+    try:
+        changed = config_store.refresh()
+    except Exception as e:
+        print(f"Failed to reload configuration, keeping the current one: {e}")
+        return
+
+    if changed:
+        print("Configuration reloaded successfully!")
+    else:
+        print("Configuration unchanged.")
+    apply_configuration()
+
+# Function to bring the log settings and the labels in line with the newest configuration, runs on the Tk thread
+def apply_configuration():
+    global applied_config_version
+    applied_config_version = config_store.snapshot.version
+    config = config_store.config  # Log settings were validated when the file was parsed
+    diagnostics.configure(config["LOG_LEVEL"], config["LOG_SAMPLE_EVERY"])
+
+    # Update the UI with the new color labels
+    for station in stations:
+        station.set_cable(station.cable)
+
+# Function called by the config watcher thread when the .env changed on disk
+def on_configuration_changed(snapshot):
+    # Swap the plans right away so the next inspected frame already uses them,
+    # the labels follow on the Tk thread in check_configuration()
+    for station in stations:
+        station.swap_plan(snapshot)
+
+# Function to pick up configurations published by the watcher, polls the snapshot version on the Tk thread
+def check_configuration():
+    try:
+        if config_store.snapshot.version != applied_config_version:
+            apply_configuration()
+    finally:
+        root.after(100, check_configuration)  # Keep polling even if applying this version failed
+
+# Function to render the latest detection result of every camera, runs on the Tk thread
+def update_frame():
+    for station in stations:
+        station.render()
 
-    # Compute absolute difference per channel (B, G, R)
-    diff = np.abs(dominant_color - expected_color)
+    if camera_running:
+        root.after(10, update_frame)
+
+# Function to show the combined verdict of all cameras, called when one station's verdict changes
+def update_station_result(changed_station):
+    # Fixtures without a cable (ok is None) do not count against the others
+    seated = [station.ok for station in stations if station.ok is not None]
+    if not seated:
+        station_result_label.config(text="Station: NO CABLE", fg="gray")
+    elif all(seated):
+        station_result_label.config(text="Station: OK", fg="green")
+    else:
+        station_result_label.config(text="Station: NOT OK", fg="red")
+
+# Function to append the record of a part removed from a fixture to the parts log, runs on the Tk thread
+def record_part(station, record):
+    record = {"camera": station.camera_index, "cable": station.cable, **record}
+    with open(config_store.get("PARTS_LOG", "parts.jsonl"), "a") as parts_file:
+        parts_file.write(json.dumps(record) + "\n")
+
+# Function to refresh the latency status bar twice per second
+def update_status_bar():
+    text = latency_stats.format_status()
+    # Part counts and throughput, once PRESENCE has segmented the first parts
+    parts = sum(station.inspector.tracker.parts for station in stations)
+    if parts:
+        rates = [rate for rate in (station.inspector.tracker.parts_per_hour() for station in stations) if rate is not None]
+        text = f"{parts} parts" + (f" {sum(rates):.0f}/h" if rates else "") + " | " + text
+    status_label.config(text=text)
+    status_label.after(500, update_status_bar)
+
+# Function to export the latency statistics to a JSON file
+def export_latency_stats():
+    destination_path = filedialog.asksaveasfilename(
+        defaultextension=".json",
+        filetypes=[("JSON File", "*.json")],
+        initialfile="latency.json",
+        title="Save Latency Statistics As"
+    )
 
-    # Check if all channels are within tolerance range
-    return np.all(diff <= TOLERANCE)
+    if destination_path:  # Check if the user selected a location
+        latency_stats.dump(destination_path)
+        print(f"Latency statistics exported successfully to {destination_path}")
 
-# Function to update the camera feed and color detection
-def update_frame():
-    global cap, current_colors, current_roi
-    if cap is not None and cap.isOpened():
-        ret, frame = cap.read()
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = cv2.resize(frame, (640, 480))
-            img = ImageTk.PhotoImage(image=Image.fromarray(frame))
-            camera_label.config(image=img)
-            camera_label.image = img
-
-            # Detect colors in each ROI and compare with expected colors
-            all_green = True  # Assume all pins are green initially
-            for i, (pin_name, expected_color) in enumerate(current_colors):
-                if i < len(current_roi):  # Ensure we don't exceed the number of ROIs
-                    roi = current_roi[i][1]  # Get the ROI for this pin
-                    if detect_color(frame, expected_color, roi):
-                        color_labels[i].config(image=green_icon, fg="green")
-                    else:
-                        color_labels[i].config(image=red_icon, fg="red")
-                        all_green = False  # At least one pin is not green
-
-                    # Draw the ROI on the frame for visualization
-                    x, y, w, h = roi
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(frame, pin_name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-
-            # Update the result label based on whether all pins are green
-            if all_green:
-                result_label.config(text="Result: OK", fg="green")
-            else:
-                result_label.config(text="Result: NOT OK", fg="red")
+# Function to start the detection threads of every camera
+def start_pipeline():
+    for station in stations:
+        station.start()
 
-    if camera_running:
-        camera_label.after(10, update_frame)
+# Function to stop the detection threads, the camera sessions stay open
+def stop_pipeline():
+    for station in stations:
+        station.stop()
 
 # Function to handle properties option (placeholder)
 def show_properties():
@@ -143,129 +155,61 @@ def import_env_file():
 
     if file_path:  # If the user selected a file
         try:
-            shutil.copy(file_path, ".env")  # Overwrite the current .env file
-            messagebox.showinfo("Success", "Configuration imported successfully. Restart the application to see the new configuration.")
+            # Overwrite the current .env file in one step so the watcher never reads a partial copy
+            with open(file_path, encoding="utf-8", newline="") as source:
+                write_config_file(".env", source.read())
+            messagebox.showinfo("Success", "Configuration imported successfully. It is applied automatically.")
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to import configuration: {str(e)}")
 
-# Function to run the color or ROI detector module in a separate thread
-def run_roi_detector_12():
-    global cap
+# Function to run a detector module in a separate thread on the open session of the camera
+# inspecting `cable`, or of the first camera when no camera is bound to that cable
+def run_detector(detector, cable):
+    station = next((station for station in stations if station.cable == cable), stations[0])
+    session = station.session
+    if isinstance(session, BusSession):
+        # The detector reads the frame bus from its own process, next to the running inspection
+        subprocess.Popen(module_command(detector.__name__, ["--bus", session.name]))
+        return
 
-    # Release the camera in the main application
-    if cap is not None:
-        cap.release()
-        cap = None
+    # Pause this camera's inspection, the camera stays open and its frames go to the detector
+    station.stop()
 
-    # Start the color detector in a separate thread
+    # Start the detector in a separate thread
     def target():
-        import roi_detector_12pin  # Import the color detector module
-        roi_detector_12pin  # Call the main function of the color detector module
+        detector.run(session.reader())
 
-        # Reinitialize the camera in the main application after the detector is closed
-        global cap
-        if cap is None:
-            cap = cv2.VideoCapture(0)
+        # Resume the inspection after the detector is closed
+        if camera_running:
+            station.start()
 
     detector_thread = threading.Thread(target=target)
     detector_thread.daemon = True  # Daemonize the thread so it exits when the main program exits
     detector_thread.start()
 
-def run_roi_detector_16():
-    global cap
-
-    # Release the camera in the main application
-    if cap is not None:
-        cap.release()
-        cap = None
-
-    # Start the color detector in a separate thread
-    def target():
-        import roi_detector_16pin  # Import the color detector module
-        roi_detector_16pin  # Call the main function of the color detector module
-
-        # Reinitialize the camera in the main application after the detector is closed
-        global cap
-        if cap is None:
-            cap = cv2.VideoCapture(0)
+# Functions to run the color or ROI detector modules
+def run_roi_detector_12():
+    import roi_detector_12pin
+    run_detector(roi_detector_12pin, "12pins")
 
-    detector_thread = threading.Thread(target=target)
-    detector_thread.daemon = True  # Daemonize the thread so it exits when the main program exits
-    detector_thread.start()
+def run_roi_detector_16():
+    import roi_detector_16pin
+    run_detector(roi_detector_16pin, "16pins")
 
 def run_color_detector_12():
-    global cap
-
-    # Release the camera in the main application
-    if cap is not None:
-        cap.release()
-        cap = None
-
-    # Start the color detector in a separate thread
-    def target():
-        import color_detector_12pin  # Import the color detector module
-        color_detector_12pin  # Call the main function of the color detector module
-
-        # Reinitialize the camera in the main application after the detector is closed
-        global cap
-        if cap is None:
-            cap = cv2.VideoCapture(0)
-
-    detector_thread = threading.Thread(target=target)
-    detector_thread.daemon = True  # Daemonize the thread so it exits when the main program exits
-    detector_thread.start()
+    import color_detector_12pin
+    run_detector(color_detector_12pin, "12pins")
 
 def run_color_detector_16():
-    global cap
-
-    # Release the camera in the main application
-    if cap is not None:
-        cap.release()
-        cap = None
-
-    # Start the color detector in a separate thread
-    def target():
-        import color_detector_16pin  # Import the color detector module
-        color_detector_16pin  # Call the main function of the color detector module
-
-        # Reinitialize the camera in the main application after the detector is closed
-        global cap
-        if cap is None:
-            cap = cv2.VideoCapture(0)
-
-    detector_thread = threading.Thread(target=target)
-    detector_thread.daemon = True  # Daemonize the thread so it exits when the main program exits
-    detector_thread.start()
-
-# Function to update the color list based on the selected configuration
-def update_color_list(config):
-    global current_colors, current_roi, color_labels
-
-    # Clear existing labels
-    for label in color_labels:
-        label.destroy()  # Properly remove old labels
-    color_labels.clear()  # Empty the list
-
-    # Update the current colors based on selection
-    if config == "12pins":
-        current_colors = CABLE12PINS
-        current_roi = CABLE12ROI
-    elif config == "16pins":
-        current_colors = CABLE16PINS
-        current_roi = CABLE16ROI
-
-    # Create new labels for the updated color list
-    for pin_name, _ in current_colors:
-        label = tk.Label(color_frame, text=pin_name, image=red_icon, compound=tk.LEFT, fg="red")
-        label.pack(anchor=tk.W, pady=2)
-        color_labels.append(label)
+    import color_detector_16pin
+    run_detector(color_detector_16pin, "16pins")
 
 # Function to start the camera
 def start_camera():
-    global cap, camera_running
+    global camera_running
     if not camera_running:
-        cap = cv2.VideoCapture(0)
+        start_pipeline()
         camera_running = True
         play_button.config(state=tk.DISABLED)
         stop_button.config(state=tk.NORMAL)
@@ -273,13 +217,14 @@ def start_camera():
 
 # Function to stop the camera
 def stop_camera():
-    global cap, camera_running
+    global camera_running
     if camera_running:
-        cap.release()
+        stop_pipeline()
         camera_running = False
         play_button.config(state=tk.NORMAL)
         stop_button.config(state=tk.DISABLED)
-        camera_label.config(image=None)  # Clear the camera feed
+        for station in stations:
+            station.clear()  # Clear the camera feed
 
 # Initialize the main window
 root = tk.Tk()
@@ -295,12 +240,11 @@ toolbar.add_cascade(label="Properties", menu=properties_menu)
 properties_menu.add_command(label="Settings", command=show_properties)
 properties_menu.add_command(label="Export Settings", command=export_env_file)
 properties_menu.add_command(label="Import .env", command=import_env_file)
+properties_menu.add_command(label="Export Latency Stats", command=export_latency_stats)
 
-# Configuration menu
+# Configuration menu, filled in once the stations exist
 config_menu = tk.Menu(toolbar, tearoff=0)
 toolbar.add_cascade(label="Configuration", menu=config_menu)
-config_menu.add_command(label="12-Pin Cable", command=lambda: update_color_list("12pins"))
-config_menu.add_command(label="16-Pin Cable", command=lambda: update_color_list("16pins"))
 
 # Color detection menu
 color_detection_menu = tk.Menu(toolbar, tearoff=0)
@@ -331,27 +275,59 @@ stop_button.pack(side=tk.LEFT, padx=5)
 reload_button = tk.Button(toolbar_frame, image=reload_icon, command=reload_configuration, borderwidth=0)
 reload_button.pack(side=tk.LEFT, padx=5)
 
-# Camera feed section
-camera_frame = tk.Frame(root, width=640, height=480)
-camera_frame.pack(side=tk.LEFT, padx=10, pady=10)
-
-camera_label = tk.Label(camera_frame)
-camera_label.pack()
-
-# Color list section
-color_frame = tk.Frame(root, width=200, height=480)
-color_frame.pack(side=tk.RIGHT, padx=10, pady=10)
-
-# Add a result label above the pins
-result_label = tk.Label(color_frame, text="Result: ", font=("Arial", 12, "bold"))
-result_label.pack(anchor=tk.W, pady=10)
+# Status bar with the per-stage latencies and frame rates
+status_label = tk.Label(root, text="", anchor=tk.W, font=("Arial", 8))
+status_label.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
 
 # Load icons
 green_icon = ImageTk.PhotoImage(Image.open("green_icon.png").resize((20, 20)))
 red_icon = ImageTk.PhotoImage(Image.open("red_icon.png").resize((20, 20)))
 
+# Load the configuration before building the stations, it lists the cameras
+try:
+    config_store.refresh()
+except Exception as e:
+    print(f"Failed to load configuration: {e}")
+cameras = config_store.config["CAMERAS"]
+
+# Combined verdict of all cameras, only needed when there is more than one
+if len(cameras) > 1:
+    station_result_label = tk.Label(toolbar_frame, text="Station: ", font=("Arial", 12, "bold"))
+    station_result_label.pack(side=tk.RIGHT, padx=10)
+
+# One camera feed and pin list per fixture, side by side
+for camera_index, cable in cameras:
+    # Name the stages per camera when several pipelines share the latency stats
+    stats = ScopedStats(latency_stats, f"cam{camera_index} ") if len(cameras) > 1 else latency_stats
+    # The camera session opens the camera once and stays open for the life of the app,
+    # with FRAME_BUS it captures in its own process and shares the frames with other processes
+    profile = config_store.config["CAMERA_PROFILES"].get(camera_index)
+    # Entries that are not a camera index replay a file, a folder or a synthetic source, see sources.py
+    if isinstance(camera_index, int) and config_store.flag("FRAME_BUS"):
+        session = BusSession(camera_index, stats, profile=profile)
+    else:
+        session = CameraSession(camera_index, stats, profile, config_store.config)
+    session.start()
+    station = InspectionStation(root, session, cable, config_store, (green_icon, red_icon), stats,
+                                update_station_result if len(cameras) > 1 else None, record_part)
+    station.pack(side=tk.LEFT)
+    stations.append(station)
+
+    # Cable selection, one submenu per camera when there are several
+    menu = config_menu
+    if len(cameras) > 1:
+        menu = tk.Menu(config_menu, tearoff=0)
+        config_menu.add_cascade(label=f"Camera {camera_index}", menu=menu)
+    menu.add_command(label="12-Pin Cable", command=lambda station=station: station.set_cable("12pins"))
+    menu.add_command(label="16-Pin Cable", command=lambda station=station: station.set_cable("16pins"))
+    menu.add_command(label="Learn Empty Fixture", command=station.learn_empty_fixture)
+
 # Initialize color labels
-reload_configuration()
+apply_configuration()
+
+# Watch the .env so calibrations and imports are applied without pressing reload
+config_watcher = ConfigWatcher(config_store, on_configuration_changed)
+config_watcher.start()
 '''
 color_labels = []
 for pin_name, _ in CABLE12PINS:
@@ -360,15 +336,19 @@ for pin_name, _ in CABLE12PINS:
     color_labels.append(label)
 '''
 
-# Initialize camera
-cap = cv2.VideoCapture(0)
+# Start inspecting, capture and detection run on their own threads
+start_pipeline()
 
-# Start updating the frame
+# Start rendering the detection results
 update_frame()
+update_status_bar()
+check_configuration()
 
 # Run the application
 root.mainloop()
 
-# Release the camera when the app is closed
-if cap is not None:
-    cap.release()
\ No newline at end of file
+# Release the cameras when the app is closed
+config_watcher.stop()
+stop_pipeline()
+for station in stations:
+    station.session.close()
\ No newline at end of file
@@ -6,7 +6,9 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('*.png', 'images')],
-    hiddenimports=[],
+    # Run in child processes through --run-module, see framebus.module_command()
+    hiddenimports=['framebus', 'roi_detector_12pin', 'roi_detector_16pin', 'color_detector_12pin',
+                   'color_detector_16pin'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
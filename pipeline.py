@@ -0,0 +1,372 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from diaglog import DEBUG, diagnostics
+from inspection import FRAME_SIZE, ChangeGate
+from locator import PlanAligner
+from presence import STABLE, PartTracker
+from sources import open_source
+from stabilizer import VerdictStabilizer
+
+
+class FramePool:
+    """Free list of reusable frame buffers.
+
+    A buffer is owned by exactly one stage at a time: the stage that takes it
+    from `acquire()` hands it on through the queues, and whichever stage is
+    done with it last calls `release()`. When every buffer is in flight a new
+    one is allocated, and buffers beyond `size` are left to the garbage
+    collector, so a missed release only costs an allocation.
+    """
+
+    def __init__(self, size=6):
+        self.size = size
+        self._free = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Return a free buffer of the given shape, or a new one"""
+        with self._lock:
+            while self._free:
+                buffer = self._free.pop()
+                if buffer.shape == shape and buffer.dtype == dtype:
+                    return buffer
+                # Buffers of an old capture resolution are dropped
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buffer):
+        """Give a buffer back once no stage reads it anymore"""
+        if buffer is None:
+            return
+        with self._lock:
+            if len(self._free) < self.size:
+                self._free.append(buffer)
+
+
+class LatestQueue:
+    """Bounded queue where new items push out the oldest unread ones.
+
+    Producers never block: when the queue is full the oldest item is dropped,
+    so a slow consumer always sees the most recent frame instead of a backlog.
+    `on_drop` is called with every item that is dropped unread.
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Add an item, dropping the oldest one if the queue is full"""
+        with self._cond:
+            dropped = self._items.popleft() if len(self._items) >= self.maxsize else None
+            self._items.append(item)
+            self._cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """Wait for the next item, returns None if the timeout expires"""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def get_nowait(self):
+        """Return the next item or None without waiting"""
+        with self._cond:
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def clear(self):
+        """Drop all pending items"""
+        with self._cond:
+            dropped = list(self._items)
+            self._items.clear()
+        if self.on_drop is not None:
+            for item in dropped:
+                self.on_drop(item)
+
+
+class CaptureThread(threading.Thread):
+    """Owns the camera and pushes (timestamp, frame) pairs into a LatestQueue.
+
+    `camera_index` can also be any other source spec of sources.py, files,
+    folders and synthetic sources are replayed in a loop at their frame rate.
+
+    Frames are read into buffers taken from `pool`, ownership of each buffer
+    passes to whoever takes the pair from the queue. `out_queue` can be
+    swapped while the thread runs, frames read while it is None go straight
+    back to the pool so the camera keeps streaming and stays settled.
+    """
+
+    def __init__(self, camera_index, out_queue, stats=None, pool=None, profile=None, config=None, realtime=True):
+        super().__init__(daemon=True)
+        self.camera_index = camera_index
+        self.profile = profile  # Capture profile, see camera.py
+        self.config = config  # Cable profiles, only needed by synthetic sources
+        self.realtime = realtime  # False reads replayed sources as fast as possible, for load tests
+        self.out_queue = out_queue
+        self.stats = stats  # Optional LatencyStats
+        self.pool = pool if pool is not None else FramePool()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        # Open the camera here so a slow open never blocks the GUI
+        cap = open_source(self.camera_index, self.profile, self.config, self.realtime, loop=True)
+        shape = None  # Capture shape, known after the first frame
+        try:
+            while not self.stop_event.is_set():
+                start = time.perf_counter()
+                buffer = self.pool.acquire(shape) if shape is not None else None
+                ret, frame = cap.read(buffer)
+                if not ret:
+                    self.pool.release(buffer)
+                    time.sleep(0.01)  # Avoid spinning when the camera is not ready
+                    continue
+                if frame is not buffer:
+                    # OpenCV allocated a new array, the camera resolution is new or changed
+                    self.pool.release(buffer)
+                    shape = frame.shape
+                if self.stats is not None:
+                    self.stats.record("read", time.perf_counter() - start)
+                    self.stats.tick("capture")
+                out_queue = self.out_queue
+                if out_queue is None:
+                    self.pool.release(frame)
+                else:
+                    out_queue.put((time.time(), frame))
+        finally:
+            cap.release()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class DetectionWorker(threading.Thread):
+    """Takes the newest captured frame, inspects it and publishes the result.
+
+    The result carries the frame buffer on to the render stage, which
+    releases it back to the pool.
+    """
+
+    def __init__(self, in_queue, out_queue, inspect, stats=None):
+        super().__init__(daemon=True)
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.inspect = inspect  # Callable(frame) -> result
+        self.stats = stats  # Optional LatencyStats
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            item = self.in_queue.get(timeout=0.1)
+            if item is None:
+                continue
+            timestamp, frame = item
+            self.out_queue.put(self.inspect(frame))
+            if self.stats is not None:
+                self.stats.tick("detection")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class Inspector:
+    """Inspects the frames of one fixture on the detection thread, without any Tk.
+
+    Each frame goes through the part tracker (`presence_enabled`), the
+    connector aligner (`locate_enabled`), the change gate (`gate_enabled`)
+    and the verdict stabilizer (`stabilize_enabled`). `plan` and the flags
+    are plain attributes, assigning them from another thread is picked up
+    on the next frame. `inspect()` returns (frame, pins, matches, wiring),
+    matches and wiring are None when no cable is seated.
+    """
+
+    def __init__(self, stats, camera_index=None):
+        self.stats = stats  # LatencyStats or ScopedStats
+        self.camera_index = camera_index  # Only used in diagnostics
+        self.plan = None
+        # Frames that look like the last inspected one reuse its verdict, see ChangeGate
+        self.gate = ChangeGate()
+        self.gate_enabled = True
+        self.last_evaluation = None  # (matches, distances, wiring) of the last inspected frame
+        self.last_verdict = None  # Pin verdicts shown for it, after the stabilizer
+        # With PRESENCE on, only cables seated in the fixture are inspected, one record per part
+        self.tracker = PartTracker()
+        self.presence_enabled = False
+        self.finished_parts = deque()  # Part records waiting for the caller
+        self.relearn = False  # Take the next frame as the empty fixture
+        # Pin verdicts only change when several frames agree, see VerdictStabilizer
+        self.stabilizer = VerdictStabilizer()
+        self.stabilize_enabled = True
+        self.stabilized_plan = None  # Plan the stabilizer's statistics belong to
+        # With AUTO_LOCATE on, the ROIs follow the connector when the fixture moves
+        self.aligner = PlanAligner()
+        self.locate_enabled = False
+
+    def reset(self):
+        """Forget every earlier frame, for when the fixture may have changed meanwhile"""
+        self.gate.reset()
+        self.tracker.reset()
+        self.stabilized_plan = None
+        self.aligner.reset()
+
+    def inspect(self, frame):
+        """Inspect a captured frame"""
+        # Evaluate all pins in one batched pass on the raw camera frame, the ROIs
+        # are mapped to the capture resolution so only the ROI pixels are read
+        plan = self.plan
+        # The ROIs moved onto the connector, the plan itself keeps the calibrated ones
+        located = self.aligner.align(frame, plan) if self.locate_enabled else plan
+        pins = list(zip(located.names, located.scaled_rois(FRAME_SIZE).tolist()))
+        tracker = self.tracker if self.presence_enabled else None
+        if tracker is not None:
+            if self.relearn:
+                self.relearn = False
+                tracker.reset()
+            record = tracker.update(frame, plan)
+            if record is not None:
+                self.finished_parts.append(record)
+            if tracker.state != STABLE:
+                # The next cable starts with fresh statistics and is inspected on its first frame
+                self.stabilized_plan = None
+                self.gate.reset()
+                self.last_evaluation = self.last_verdict = None
+                return frame, pins, None, None  # No seated cable, nothing to inspect
+
+        if self.stabilize_enabled and not self.stabilizer.settled:
+            # Gated frames add no evidence, inspect until the stabilizer settled on what the frames show
+            self.gate.reset()
+        if self.gate_enabled and not self.gate.changed(frame, located):
+            # Nothing moved since the last inspected frame, its verdict still holds
+            matches, wiring = self.last_verdict, self.last_evaluation[2]
+            self.stats.tick("gated")
+        else:
+            with self.stats.time("roi"):
+                dominant = located.dominant_colors(frame)
+                matches, distances = located.compare(dominant, bgr=True)
+            wiring = None
+            if not matches.all():
+                # Tell swapped wires from wrong ones, only the failed pins are assigned
+                with self.stats.time("wiring"):
+                    wiring = located.identify(dominant, matches, bgr=True)
+            self.last_evaluation = (matches, distances, wiring)
+            if diagnostics.enabled(DEBUG):
+                diagnostics.log(DEBUG, "inspection", camera=self.camera_index,
+                                matches=matches.tolist(), distances=distances.tolist())
+            if self.stabilize_enabled:
+                # Only inspected frames are evidence, a gated one would count the same frame again
+                if plan is not self.stabilized_plan:
+                    self.stabilizer.reset(len(plan))
+                    self.stabilized_plan = plan
+                matches = self.stabilizer.update(matches, distances, plan.pin_tolerances)
+            self.last_verdict = matches
+        if tracker is not None:
+            tracker.judge(plan.names, matches, wiring=wiring)
+        return frame, pins, matches, wiring
+
+
+class CameraSession:
+    """Keeps one camera open for the life of the app and hands its frames to the active consumer.
+
+    Opening a USB camera and letting its exposure settle takes seconds, so
+    the capture thread starts once and only the consumer changes: the live
+    inspection Pipeline or a calibrator through `reader()`. Switching is a
+    reference swap, only one consumer receives frames at a time.
+    """
+
+    def __init__(self, camera_index, stats=None, profile=None, config=None, realtime=True):
+        self.camera_index = camera_index
+        self.pool = FramePool()
+        self.capture = CaptureThread(camera_index, None, stats, self.pool, profile, config, realtime)
+
+    def start(self):
+        self.capture.start()
+
+    def close(self, timeout=2.0):
+        """Stop the capture thread and wait for the camera to be released"""
+        self.capture.stop()
+        self.capture.join(timeout)
+
+    def attach(self, queue):
+        """Send every new frame to `queue`, replacing the previous consumer"""
+        self.capture.out_queue = queue
+
+    def detach(self, queue):
+        """Stop sending frames to `queue` if it is still the active consumer"""
+        if self.capture.out_queue is queue:
+            self.capture.out_queue = None
+
+    def reader(self, timeout=2.0):
+        """Attach a VideoCapture-like reader, for consumers that call read() in a loop"""
+        return SessionReader(self, timeout)
+
+
+class SessionReader:
+    """Drop-in for cv2.VideoCapture reading from a CameraSession.
+
+    The frame returned by `read()` stays valid until the next call, then its
+    buffer goes back to the pool. `release()` detaches the reader but leaves
+    the camera open.
+    """
+
+    def __init__(self, session, timeout=2.0):
+        self.session = session
+        self.timeout = timeout
+        self.queue = LatestQueue(on_drop=lambda item: session.pool.release(item[1]))
+        self._frame = None
+        session.attach(self.queue)
+
+    def read(self):
+        item = self.queue.get(self.timeout)
+        if item is None:
+            return False, None
+        self.session.pool.release(self._frame)  # The caller is done with the previous frame
+        self._frame = item[1]
+        return True, self._frame
+
+    def release(self):
+        self.session.detach(self.queue)
+        self.queue.clear()
+
+
+class Pipeline:
+    """Capture -> detection -> render stages linked by latest-frame-wins queues.
+
+    Capture is done by a CameraSession that outlives the pipeline, starting
+    and stopping a pipeline never reopens the camera. The render stage is
+    left to the caller: poll `results` from the Tk thread with `get_nowait()`
+    so the GUI never waits on the camera or the detector. `inspect` must
+    return a tuple whose first item is the frame it was given, and the caller
+    hands that frame back with `release()` once it is drawn.
+    """
+
+    def __init__(self, session, inspect, stats=None):
+        self.session = session
+        self.pool = session.pool
+        self.frames = LatestQueue(on_drop=lambda item: self.pool.release(item[1]))
+        self.results = LatestQueue(on_drop=lambda result: self.pool.release(result[0]))
+        self.detector = DetectionWorker(self.frames, self.results, inspect, stats)
+
+    def release(self, frame):
+        """Return a captured frame to the pool once the render stage is done with it"""
+        self.pool.release(frame)
+
+    def start(self):
+        self.detector.start()
+        self.session.attach(self.frames)
+
+    def stop(self, timeout=2.0):
+        """Detach from the camera and stop the detection thread, the camera stays open"""
+        self.session.detach(self.frames)
+        self.detector.stop()
+        self.detector.join(timeout)
+        self.frames.clear()
@@ -0,0 +1,212 @@
+"""Presence detection and part-cycle segmentation.
+
+The fixture region is the bounding box of all ROIs of a plan plus a margin.
+A small thumbnail of that region is compared with a learned image of the
+empty fixture at the ROIs to tell whether a cable is present, and with the
+previous thumbnail to tell whether anything in the region is still moving. `PartTracker` turns that into
+part cycles:
+
+    empty -> inserted (moving) -> stable (inspected) -> removed -> empty
+
+and keeps exactly one verdict record per part.
+"""
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from wiring import wiring_faults
+
+EMPTY = "empty"
+INSERTED = "inserted"
+STABLE = "stable"
+
+
+class PresenceDetector:
+    """Measures how much of the ROIs differ from the empty fixture, and how much of the fixture region moved.
+
+    The empty fixture is learned from the first frame, or with `learn()`,
+    and follows slow lighting changes through `adapt()`.
+    """
+
+    def __init__(self, threshold=30, size=(64, 48), margin=0.1, adapt_rate=0.02):
+        self.threshold = threshold
+        self.size = size
+        self.margin = margin
+        self.adapt_rate = adapt_rate
+        self.thumbnail = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.previous = np.empty_like(self.thumbnail)
+        self.diff = np.empty_like(self.thumbnail)
+        self.background = None  # float32 image of the empty fixture
+        self._empty = np.empty_like(self.thumbnail)
+        self._region_key = None
+        self._region = None
+        self._mask = None  # Thumbnail samples that fall inside an ROI
+
+    def _compile(self, plan, shape):
+        # Bounding box of every ROI at the frame resolution, grown by the margin
+        height, width = shape[:2]
+        rois = plan.scaled_rois((width, height))
+        x0, y0, x1, y1 = 0, 0, width, height
+        if len(rois):
+            x0, y0 = rois[:, 0].min(), rois[:, 1].min()
+            x1, y1 = (rois[:, 0] + rois[:, 2]).max(), (rois[:, 1] + rois[:, 3]).max()
+            pad_x, pad_y = int((x1 - x0) * self.margin), int((y1 - y0) * self.margin)
+            x0, y0 = max(int(x0) - pad_x, 0), max(int(y0) - pad_y, 0)
+            x1, y1 = min(int(x1) + pad_x, width), min(int(y1) + pad_y, height)
+            if x1 <= x0 or y1 <= y0:
+                x0, y0, x1, y1 = 0, 0, width, height
+
+        # The ROIs in thumbnail samples, every ROI covers at least one sample
+        mask = np.zeros((self.size[1], self.size[0]), dtype=bool)
+        scale_x, scale_y = self.size[0] / (x1 - x0), self.size[1] / (y1 - y0)
+        for x, y, w, h in rois.tolist():
+            left, top = int((x - x0) * scale_x), int((y - y0) * scale_y)
+            right, bottom = int(np.ceil((x + w - x0) * scale_x)), int(np.ceil((y + h - y0) * scale_y))
+            mask[max(top, 0):max(bottom, top + 1), max(left, 0):max(right, left + 1)] = True
+        if not mask.any():
+            mask[:] = True
+        return (slice(y0, y1), slice(x0, x1)), np.repeat(mask[:, :, np.newaxis], 3, axis=2)
+
+    def measure(self, frame, plan):
+        """Return (presence, motion): the fraction of ROI sample channels that differ from the
+        empty fixture, and the fraction of region sample channels that differ from the previous frame"""
+        key = (plan, frame.shape)
+        if key != self._region_key:
+            region, self._mask = self._compile(plan, frame.shape)
+            self._mask_count = np.count_nonzero(self._mask)
+            if region != self._region:
+                self.background = None  # The region moved, relearn it
+            self._region = region
+            self._region_key = key
+        self.thumbnail, self.previous = self.previous, self.thumbnail
+        cv2.resize(frame[self._region], self.size, dst=self.thumbnail, interpolation=cv2.INTER_NEAREST)
+        if self.background is None:
+            self.learn()
+            return 0.0, 0.0
+        # Channels are counted on their own, reducing them per sample costs more than the rest
+        cv2.absdiff(self.thumbnail, self.previous, dst=self.diff)
+        motion = np.count_nonzero(self.diff > self.threshold) / self.diff.size
+        cv2.absdiff(self.thumbnail, self._empty, dst=self.diff)
+        presence = np.count_nonzero((self.diff > self.threshold) & self._mask) / self._mask_count
+        return presence, motion
+
+    def learn(self):
+        """Take the last measured thumbnail as the empty fixture"""
+        self.background = self.thumbnail.astype(np.float32)
+        np.copyto(self._empty, self.thumbnail)
+
+    def adapt(self):
+        """Blend the last measured thumbnail into the empty fixture, call only while it is empty"""
+        cv2.accumulateWeighted(self.thumbnail, self.background, self.adapt_rate)
+        np.copyto(self._empty, self.background, casting="unsafe")
+
+    def reset(self):
+        """Learn the empty fixture again from the next frame"""
+        self.background = None
+
+
+class PartTracker:
+    """Segments a stream of frames into part cycles.
+
+    A part is inserted once more than `present` of the ROI samples differ
+    from the empty fixture for `confirm` frames in a row. It is
+    stable after `settle` frames with less than `still` motion, and removed
+    once less than `absent` differs for `confirm` frames. Only stable frames
+    need to be inspected, their verdicts are handed in with `judge()`. A part
+    removed before it ever settled, such as a hand passing through, produces
+    no record.
+    """
+
+    def __init__(self, detector=None, present=0.2, absent=0.05, still=0.01, confirm=3, settle=5):
+        self.detector = detector if detector is not None else PresenceDetector()
+        self.present = present
+        self.absent = absent
+        self.still = still
+        self.confirm = confirm
+        self.settle = settle
+        self.state = EMPTY
+        self.parts = 0  # Parts with a record so far
+        self.completed = deque(maxlen=64)  # Removal times of the last parts, for the hourly rate
+        self._count = 0  # Consecutive frames agreeing with the next state
+        self._absent = 0  # Consecutive frames where the fixture looks empty again
+        self._part = None
+
+    def update(self, frame, plan, frame_id=None, timestamp=None):
+        """Advance the cycle with a new frame, returns the record of a part when it was removed"""
+        timestamp = time.time() if timestamp is None else timestamp
+        presence, motion = self.detector.measure(frame, plan)
+
+        if self.state == EMPTY:
+            if presence > self.present:
+                self._count += 1
+                if self._count >= self.confirm:
+                    self.state = INSERTED
+                    self._count = 0
+                    self._part = {"inserted": timestamp, "inserted_frame": frame_id, "stable": None,
+                                  "stable_frame": None, "ok": None, "failed": [], "wiring": [], "first_ok": None}
+            else:
+                self._count = 0
+                if motion < self.still:
+                    self.detector.adapt()  # Follow slow lighting changes of the empty fixture
+            return None
+
+        if presence < self.absent:
+            self.state = INSERTED  # Being pulled out, stop inspecting until it settles again
+            self._count = 0
+            self._absent += 1
+            if self._absent >= self.confirm:
+                return self._remove(frame_id, timestamp)
+            return None
+        self._absent = 0
+
+        if self.state == INSERTED:
+            self._count = self._count + 1 if motion < self.still else 0
+            if self._count >= self.settle:
+                self.state = STABLE
+                self._count = 0
+                if self._part["stable"] is None:
+                    self._part["stable"] = timestamp
+                    self._part["stable_frame"] = frame_id
+        elif motion >= self.still:
+            self.state = INSERTED  # Being re-seated, wait for it to settle again
+            self._count = 0
+        else:
+            self._count = 0
+        return None
+
+    def judge(self, names, matches, timestamp=None, wiring=None):
+        """Record the verdict of a stable frame, the last one before removal is the part's verdict.
+        `wiring` from InspectionPlan.identify() adds the misplaced wires to the record."""
+        ok = bool(np.all(matches))
+        self._part["ok"] = ok
+        self._part["failed"] = [name for name, matched in zip(names, matches) if not matched]
+        self._part["wiring"] = [] if ok or wiring is None else [
+            fault for fault in wiring_faults(names, wiring) if fault["pin"] in self._part["failed"]]
+        if ok and self._part["first_ok"] is None:
+            self._part["first_ok"] = time.time() if timestamp is None else timestamp
+
+    def _remove(self, frame_id, timestamp):
+        part = self._part
+        self.state = EMPTY
+        self._count = self._absent = 0
+        self._part = None
+        if part["stable"] is None:
+            return None  # Never settled, not a part
+        self.parts += 1
+        self.completed.append(timestamp)
+        return {"part": self.parts, **part, "removed": timestamp, "removed_frame": frame_id}
+
+    def parts_per_hour(self):
+        """Throughput over the last completed parts, None until there are two"""
+        if len(self.completed) < 2 or self.completed[-1] <= self.completed[0]:
+            return None
+        return (len(self.completed) - 1) * 3600 / (self.completed[-1] - self.completed[0])
+
+    def reset(self):
+        """Forget the current part and learn the empty fixture from the next frame"""
+        self.state = EMPTY
+        self._count = self._absent = 0
+        self._part = None
+        self.detector.reset()
@@ -1,14 +1,17 @@
+import argparse
+
 import cv2
 import numpy as np
-from dotenv import load_dotenv, set_key
+from dotenv import load_dotenv
 import os
 import json
 
-# Load environment variables from .env file
-load_dotenv()
-pin16names = json.loads(os.getenv("PIN16NAMES", "[]"))
+from camera import open_camera, profile_key
+from config_store import update_config
+from locator import save_anchor
 
-# Global variables
+# Global variables, reset by run()
+pin16names = []  # Pin names from the .env file
 clicked_points = []  # Stores clicked points
 detected_colors = []  # Stores detected colors
 rois = []  # Stores ROIs
@@ -54,8 +57,16 @@ def save_results_to_env():
     cable_pins = [[pin16names[i], color] for i, color in enumerate(detected_colors)]
     # Prepare the CABLE16ROI variable
     cable_rois = [[pin16names[i], roi] for i, roi in enumerate(rois)]
-    # Write the variables to the .env file using double quotes
-    set_key(".env", "CABLE16ROI", json.dumps(cable_rois))
+    # Write all the variables to the .env file in one atomic update, so the
+    # running inspection never reads a half-saved calibration.
+    # The ROI size records the resolution the ROIs were taken at, the anchor is the
+    # connector around the ROIs, so AUTO_LOCATE can find it again when the fixture moves.
+    anchor = save_anchor(frame, rois, "cable16_anchor.png")
+    update_config(".env", {
+        "CABLE16ROI": json.dumps(cable_rois),
+        "CABLE16ROI_SIZE": json.dumps([frame.shape[1], frame.shape[0]]),
+        "CABLE16ANCHOR": json.dumps(anchor),
+    })
     print("Results saved to .env file.")
 
 # Function to display all ROIs and RGB values on the screen
@@ -72,68 +83,97 @@ def display_results():
         cv2.putText(frame, color_text, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
     '''
 
-# Initialize the camera
-cap = cv2.VideoCapture(0)
-
-# Create a named window and set the mouse callback
-cv2.namedWindow("Camera Feed")
-cv2.setMouseCallback("Camera Feed", get_clicked_point)
-
-print("Click on the camera feed to define ROIs for each pin. Press 'q' to quit.")
-
-while True:
-    # Capture frame-by-frame
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    # Define the header height
-    header_height = 40
-    frame_width = frame.shape[1]
-
-    # Create a black header (same width as the frame)
-    header = np.zeros((header_height, frame_width, 3), dtype=np.uint8)
+# Function to run the calibration. `cap` is anything with VideoCapture's read() and release(),
+# e.g. a reader of the main window's camera session; camera 0 is opened when it is None.
+def run(cap=None):
+    global pin16names, clicked_points, detected_colors, rois, current_pin, frame
+
+    # Load environment variables from .env file, the names may have changed since the last run
+    load_dotenv(override=True)
+    pin16names = json.loads(os.getenv("PIN16NAMES", "[]"))
+    clicked_points = []
+    detected_colors = []
+    rois = []
+    current_pin = 0
+
+    # Initialize the camera
+    if cap is None:
+        cap = open_camera(0, json.loads(os.getenv(profile_key(0)) or "{}"))
+
+    # Create a named window and set the mouse callback
+    cv2.namedWindow("Camera Feed")
+    cv2.setMouseCallback("Camera Feed", get_clicked_point)
+
+    print("Click on the camera feed to define ROIs for each pin. Press 'q' to quit.")
+
+    while True:
+        # Capture frame-by-frame
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        # Define the header height
+        header_height = 40
+        frame_width = frame.shape[1]
+
+        # Create a black header (same width as the frame)
+        header = np.zeros((header_height, frame_width, 3), dtype=np.uint8)
+
+        # Set legend text
+        if current_pin < num_pins:
+            legend_text = f"Setting Pin {current_pin + 1}, click in the selected area to store the area and color."
+        else:
+            legend_text = "All pins configured. Press 'q' to quit."
+
+        # Calculate text position
+        text_size = cv2.getTextSize(legend_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
+        text_x = (frame_width - text_size[0]) // 2  # Center the text horizontally
+        text_y = header_height - 10  # Adjust vertical position within the header
+
+        # Display text on the black header
+        cv2.putText(header, legend_text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+        # Stack the header on top of the camera frame
+        combined_frame = np.vstack((header, frame))
+
+        # Display the ROI for each pin as it is clicked
+        for i, roi in enumerate(rois):
+            x, y, w, h = roi
+            y += header_height  # Adjust for the header
+            cv2.rectangle(combined_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            pin_text = f"Pin {i + 1}"
+            cv2.putText(combined_frame, pin_text, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+        # If all pins are configured, display the results
+        if current_pin == num_pins:
+            display_results()
 
-    # Set legend text
-    if current_pin < num_pins:
-        legend_text = f"Setting Pin {current_pin + 1}, click in the selected area to store the area and color."
+        # Show the new frame with the header
+        cv2.imshow("Camera Feed", combined_frame)
+
+        # Check if the window is closed
+        if cv2.getWindowProperty("Camera Feed", cv2.WND_PROP_VISIBLE) < 1:
+            break
+
+        # Break the loop if 'q' or 'Q' is pressed
+        if cv2.waitKey(1) & 0xFF in [ord('q'), ord('Q')]:
+            break
+
+    # Release the camera and close the window, a session reader only detaches
+    cap.release()
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the 16-pin ROIs")
+    parser.add_argument("--bus", help="read the camera from this shared-memory frame bus instead of opening camera 0")
+    parser.add_argument("--source", help="calibrate on a video file or an image folder instead of camera 0")
+    args = parser.parse_args()
+    if args.bus:
+        from framebus import FrameBusReader
+        run(FrameBusReader(args.bus))
+    elif args.source:
+        from sources import open_source
+        run(open_source(args.source, realtime=True, loop=True))
     else:
-        legend_text = "All pins configured. Press 'q' to quit."
-
-    # Calculate text position
-    text_size = cv2.getTextSize(legend_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-    text_x = (frame_width - text_size[0]) // 2  # Center the text horizontally
-    text_y = header_height - 10  # Adjust vertical position within the header
-
-    # Display text on the black header
-    cv2.putText(header, legend_text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-
-    # Stack the header on top of the camera frame
-    combined_frame = np.vstack((header, frame))
-
-    # Display the ROI for each pin as it is clicked
-    for i, roi in enumerate(rois):
-        x, y, w, h = roi
-        y += header_height  # Adjust for the header
-        cv2.rectangle(combined_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        pin_text = f"Pin {i + 1}"
-        cv2.putText(combined_frame, pin_text, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-
-    # If all pins are configured, display the results
-    if current_pin == num_pins:
-        display_results()
-
-    # Show the new frame with the header
-    cv2.imshow("Camera Feed", combined_frame)
-
-    # Check if the window is closed
-    if cv2.getWindowProperty("Camera Feed", cv2.WND_PROP_VISIBLE) < 1:
-        break
-
-    # Break the loop if 'q' or 'Q' is pressed
-    if cv2.waitKey(1) & 0xFF in [ord('q'), ord('Q')]:
-        break
-
-# Release the camera and close the window
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+        run()
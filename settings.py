@@ -1,11 +1,9 @@
-import os
 import dotenv
 import json
 import tkinter as tk
 from tkinter import ttk, colorchooser, messagebox
 
-# Load environment variables
-dotenv.load_dotenv()
+from config_store import update_config
 
 
 class SettingsForm(tk.Toplevel):
@@ -47,9 +45,16 @@ class SettingsForm(tk.Toplevel):
 
     def load_settings(self):
         """Load settings from .env file"""
-        tolerance = int(os.getenv("TOLERANCE", "0"))
-        pin12data = json.loads(os.getenv("CABLE12PINS", "[]"))
-        pin16data = json.loads(os.getenv("CABLE16PINS", "[]"))
+        # Read the file every time the form opens, calibrators and imports change it while the app runs
+        values = dotenv.dotenv_values(".env")
+        tolerance = int(values.get("TOLERANCE") or "0")
+        pin12data = json.loads(values.get("CABLE12PINS") or "[]")
+        pin16data = json.loads(values.get("CABLE16PINS") or "[]")
+        # Calibrated profiles are saved in BGR, the form edits and saves RGB
+        for key, data in (("CABLE12PINS", pin12data), ("CABLE16PINS", pin16data)):
+            if (values.get(key + "_ORDER") or "RGB").upper() == "BGR":
+                for pin in data:
+                    pin[1] = pin[1][::-1]
         return tolerance, pin12data, pin16data
 
     def save_settings(self):
@@ -63,13 +68,10 @@ class SettingsForm(tk.Toplevel):
             pin_data.append([pin_name, pin_color])
 
         pin_data_str = json.dumps(pin_data)
+        pins_key = "CABLE12PINS" if self.pin_option_var.get() == "12 Pin Names" else "CABLE16PINS"
 
-        if self.pin_option_var.get() == "12 Pin Names":
-            dotenv.set_key(".env", "CABLE12PINS", pin_data_str)
-        else:
-            dotenv.set_key(".env", "CABLE16PINS", pin_data_str)
-
-        dotenv.set_key(".env", "TOLERANCE", str(tolerance))
+        # Save the pins and the tolerance in one atomic update
+        update_config(".env", {pins_key: pin_data_str, pins_key + "_ORDER": "RGB", "TOLERANCE": str(tolerance)})
         self.status_label.config(text="Settings Saved Successfully!", fg="green")
 
     def update_pin_fields(self, *args):
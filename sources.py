@@ -0,0 +1,206 @@
+"""Frame sources with the cv2.VideoCapture read()/release() interface.
+
+A source is picked from a spec string by `open_source()`:
+
+    0, "1"              live camera, opened with its capture profile
+    "shift1.mp4"        video file
+    "frames/"           folder of images, in name order
+    "bus:<name>"        shared-memory frame bus, see framebus.py
+    "synthetic:12pins"  frames painted from a cable profile, no camera needed,
+                        "synthetic:12pins@1920x1080" paints them at another size
+
+Files, folders and synthetic sources can be paced at their frame rate
+(`realtime=True`), as a camera would deliver them, or read as fast as
+possible for batch runs and load tests.
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+from camera import open_camera
+from inspection import CABLES, FRAME_SIZE, color_order_key, scale_rois
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+BUS_PREFIX = "bus:"
+SYNTHETIC_PREFIX = "synthetic:"
+DEFAULT_FPS = 30.0  # Pace of image folders and synthetic sources
+
+
+# Function to paint the expected colors of a cable at its ROIs on a camera-sized BGR frame
+def make_synthetic_frame(colors, rois, roi_size, size, background=40, order="RGB"):
+    width, height = size
+    frame = np.full((height, width, 3), background, dtype=np.uint8)  # Dark gray fixture
+    # ROIs are recorded at roi_size, map them onto the camera frame
+    scaled = scale_rois([roi for _, roi in rois], roi_size, size)
+    for (_, color), (x, y, w, h) in zip(colors, scaled.tolist()):
+        # Paint the expected colors as the camera would deliver them, in BGR
+        frame[max(y, 0):y + h, max(x, 0):x + w] = color if order == "BGR" else color[::-1]
+    return frame
+
+
+# Function to copy a frame into the caller's buffer when it fits, like cv2.VideoCapture.read(image)
+def _into(image, frame):
+    if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+        np.copyto(image, frame)
+        return image
+    return frame
+
+
+class Pacer:
+    """Sleeps so that frames are delivered at `fps`, does nothing when fps is None"""
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else None
+        self.next_time = None
+
+    def wait(self):
+        if self.interval is None:
+            return
+        now = time.perf_counter()
+        if self.next_time is None or now - self.next_time > self.interval:
+            self.next_time = now  # First frame, or too far behind to catch up
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += self.interval
+
+
+class VideoFileSource:
+    """Video file, optionally paced at its own frame rate and looped"""
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        self.pacer = Pacer((self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS) if realtime else None)
+        self.frame_id = -1
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        self.pacer.wait()
+        ret, frame = self.cap.read(image)
+        if not ret and self.loop and self.frame_id >= 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(image)
+        if ret:
+            self.frame_id += 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageFolderSource:
+    """Images of a folder in name order, the frame id is the file name"""
+
+    def __init__(self, path, realtime=False, loop=False, fps=DEFAULT_FPS):
+        self.path = path
+        self.loop = loop
+        self.names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.pacer = Pacer(fps if realtime else None)
+        self.position = 0
+        self.frame_id = None
+
+    def isOpened(self):
+        return bool(self.names)
+
+    def read(self, image=None):
+        # Look at every file once at most, looping over a folder of unreadable files must end
+        for _ in range(len(self.names)):
+            if self.position >= len(self.names):
+                if not self.loop:
+                    return False, None
+                self.position = 0
+            name = self.names[self.position]
+            self.position += 1
+            frame = cv2.imread(os.path.join(self.path, name))
+            if frame is not None:  # Skip unreadable files
+                self.pacer.wait()
+                self.frame_id = name
+                return True, _into(image, frame)
+        return False, None
+
+    def release(self):
+        pass
+
+
+class SyntheticSource:
+    """Frames painted from a cable profile of a loaded configuration.
+
+    Every ROI shows its expected color, except the pins listed in `wrong`
+    which show `wrong_color`. `noise` adds Gaussian noise with that standard
+    deviation, from a fixed seed so runs can be reproduced exactly. `length`
+    limits the number of frames, None runs forever.
+    """
+
+    def __init__(self, config, cable, size=FRAME_SIZE, fps=DEFAULT_FPS, realtime=False, length=None,
+                 wrong=(), wrong_color=(0, 0, 0), noise=0.0, seed=0):
+        pins_key, roi_key, size_key = CABLES[cable]
+        colors = [[pin_name, list(wrong_color) if i in wrong else color]
+                  for i, (pin_name, color) in enumerate(config[pins_key])]
+        self.template = make_synthetic_frame(colors, config[roi_key], config[size_key], size,
+                                             order=config[color_order_key(cable)])
+        self.noise = noise
+        self.random = np.random.default_rng(seed)
+        self.length = length
+        self.pacer = Pacer(fps if realtime else None)
+        self.frame_id = -1
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        if self.length is not None and self.frame_id + 1 >= self.length:
+            return False, None
+        self.pacer.wait()
+        frame = image if image is not None and image.shape == self.template.shape else np.empty_like(self.template)
+        if self.noise:
+            noisy = self.template + self.random.normal(0, self.noise, self.template.shape)
+            np.copyto(frame, np.clip(noisy, 0, 255), casting="unsafe")
+        else:
+            np.copyto(frame, self.template)
+        self.frame_id += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+# Function to open a frame source from its spec, see the module docstring. A source object
+# that is already open is returned as it is.
+def open_source(spec, profile=None, config=None, realtime=False, loop=False):
+    if hasattr(spec, "read"):
+        return spec
+    if isinstance(spec, int) or spec.isdigit():
+        return open_camera(int(spec), profile)
+    if spec.startswith(BUS_PREFIX):
+        from framebus import FrameBusReader  # framebus imports the pipeline, which imports this module
+        return FrameBusReader(spec[len(BUS_PREFIX):])
+    if spec.startswith(SYNTHETIC_PREFIX):
+        if config is None:
+            raise ValueError("A synthetic source needs the configuration with its cable profile")
+        cable, _, size = spec[len(SYNTHETIC_PREFIX):].partition("@")
+        size = tuple(int(value) for value in size.split("x")) if size else FRAME_SIZE
+        return SyntheticSource(config, cable, size, realtime=realtime)
+    if os.path.isdir(spec):
+        return ImageFolderSource(spec, realtime, loop)
+    return VideoFileSource(spec, realtime, loop)
+
+
+# Function to yield (frame_id, frame) pairs until a source runs out. The frame is only valid
+# until the next one is read, copy it to keep it.
+def iter_source(source):
+    if callable(getattr(source, "frames", None)):
+        yield from source.frames()  # Zero-copy path of the frame bus
+        return
+    frame = None
+    frame_id = 0
+    while True:
+        ret, frame = source.read(frame)
+        if not ret:
+            break
+        yield getattr(source, "frame_id", frame_id), frame
+        frame_id += 1
@@ -0,0 +1,106 @@
+"""Temporal verdict stabilizer.
+
+A single noisy frame, a hand shadow or an auto-exposure step can flip a
+pin for one frame. `VerdictStabilizer` keeps per-pin statistics over the
+recent frames in fixed arrays and only changes a pin's committed verdict
+when the evidence supports it:
+
+- early: as soon as the last `min_run` frames agree and the running mean
+  of their margin to the tolerance is more than `z` standard errors away
+  from zero, so a clean change commits after `min_run` frames. The spread
+  is never taken below `noise` levels, a few frames underestimate it;
+- by vote: when `votes` of the last `window` frames agree, so a pin that
+  hovers around its tolerance still settles.
+
+Memory is constant: a bit history and a handful of floats per pin.
+"""
+import numpy as np
+
+
+class VerdictStabilizer:
+    """Commits per-pin verdicts from a stream of per-frame verdicts, see the module docstring"""
+
+    def __init__(self, votes=3, window=5, min_run=2, z=3.0, noise=2.0):
+        if not 0 < votes <= window <= 32 or 2 * votes <= window:
+            raise ValueError("Need window/2 < votes <= window <= 32")
+        self.votes = votes
+        self.window = window
+        self.min_run = min_run
+        self.z = z
+        self.noise = noise
+        self._mask = np.uint32((1 << window) - 1)
+        self.reset(0)
+
+    def reset(self, count=None):
+        """Forget every pin, `count` changes the number of pins"""
+        count = len(self.committed) if count is None else count
+        self.history = np.zeros(count, dtype=np.uint32)  # Bit i is the match of the frame i frames ago
+        self.samples = np.zeros(count, dtype=np.int32)  # Frames seen, up to the window
+        # Running mean and variance (Welford) of the margin over the current run of agreeing frames
+        self.run_length = np.zeros(count, dtype=np.int32)
+        self.run_match = np.zeros(count, dtype=bool)
+        self.run_mean = np.zeros(count)
+        self.run_m2 = np.zeros(count)
+        self.committed = np.zeros(count, dtype=bool)  # Committed verdict, pins start as not OK
+        self.known = np.zeros(count, dtype=bool)  # Pins with a committed verdict
+
+    @property
+    def ready(self):
+        """True once every pin has a committed verdict"""
+        return bool(self.known.all())
+
+    @property
+    def settled(self):
+        """True when every frame of the window agrees with the committed verdicts, more frames
+        showing the same can not change them and a single glitch is outvoted"""
+        ok_votes = _popcount(self.history)
+        return bool((np.where(self.committed, ok_votes, self.samples - ok_votes) == self.samples).all())
+
+    def update(self, matches, distances, tolerances):
+        """Add one frame, returns the committed verdict of every pin.
+
+        `distances` are the largest per-channel differences from plan.evaluate()
+        and `tolerances` the tolerance of each pin. Their difference is the
+        margin, signed by `matches` so it always agrees with the frame's verdict.
+        """
+        matches = np.asarray(matches, dtype=bool)
+        if len(matches) != len(self.committed):
+            self.reset(len(matches))
+        margin = np.abs(np.asarray(tolerances, dtype=float) - distances) + 0.5  # Never exactly zero
+        margin = np.where(matches, margin, -margin)
+
+        # Bit history of the last `window` frames
+        self.history = ((self.history << np.uint32(1)) | matches.astype(np.uint32)) & self._mask
+        self.samples = np.minimum(self.samples + 1, self.window)
+
+        # A new run starts where the frame disagrees with the run, Welford update otherwise
+        restart = (self.run_length == 0) | (matches != self.run_match)
+        self.run_length = np.where(restart, 1, self.run_length + 1)
+        self.run_match = matches
+        delta = margin - np.where(restart, margin, self.run_mean)
+        self.run_mean = np.where(restart, margin, self.run_mean + delta / self.run_length)
+        self.run_m2 = np.where(restart, 0.0, self.run_m2 + delta * (margin - self.run_mean))
+
+        # Early commit: the run is long enough and its mean margin is clear of zero
+        variance = np.maximum(self.run_m2 / np.maximum(self.run_length - 1, 1), self.noise ** 2)
+        standard_error = np.sqrt(variance / self.run_length)
+        confident = (self.run_length >= self.min_run) & (np.abs(self.run_mean) > self.z * standard_error)
+
+        # Vote: `votes` of the last `window` frames agree
+        ok_votes = _popcount(self.history)
+        voted_ok = ok_votes >= self.votes
+        voted_not_ok = self.samples - ok_votes >= self.votes
+
+        commit = confident | voted_ok | voted_not_ok
+        verdict = np.where(confident, matches, voted_ok)
+        self.committed = np.where(commit, verdict, self.committed)
+        self.known |= commit
+        return self.committed
+
+
+# Function to count the set bits of every uint32 of an array
+def _popcount(values):
+    values = values - ((values >> np.uint32(1)) & np.uint32(0x55555555))
+    values = (values & np.uint32(0x33333333)) + ((values >> np.uint32(2)) & np.uint32(0x33333333))
+    values = (values + (values >> np.uint32(4))) & np.uint32(0x0F0F0F0F)
+    return ((values * np.uint32(0x01010101)) >> np.uint32(24)).astype(np.int32)
@@ -0,0 +1,202 @@
+import tkinter as tk
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from inspection import CABLES, FRAME_SIZE
+from pipeline import Inspector, Pipeline
+from wiring import WRONG_WIRE
+
+
+class InspectionStation(tk.Frame):
+    """Camera feed, result label and pin list of one fixture.
+
+    Every station has its own camera session and detection thread, so several
+    cameras are inspected in parallel and the Tk thread only renders the
+    newest result of each one.
+    """
+
+    def __init__(self, parent, session, cable, config_store, icons, stats, on_result=None, on_part=None):
+        super().__init__(parent)
+        self.session = session  # CameraSession, stays open when the station stops
+        self.camera_index = session.camera_index
+        self.cable = cable
+        self.config_store = config_store
+        self.green_icon, self.red_icon = icons
+        self.stats = stats  # LatencyStats or ScopedStats
+        self.on_result = on_result  # Called with the station when its overall verdict changes
+        self.on_part = on_part  # Called with the station and the record of every part removed
+        self.pipeline = None
+        self.ok = None  # Overall verdict currently shown by result_label
+        # Gate, part tracker, aligner and stabilizer, owned by the detection worker
+        self.inspector = Inspector(stats, self.camera_index)
+
+        self.color_labels = []
+        self.pin_names = []  # Pin names of color_labels, the label texts also tell misplaced wires
+        self.shown_matches = None  # Pin verdicts currently shown by color_labels
+        self.shown_texts = []
+        self.pending_matches = None  # Newest pin verdicts waiting to be applied, None when no cable is seated
+        self.pending_wiring = None  # Which pin's wire every ROI holds, see wiring.identify_wiring()
+        self.update_pending = False
+        self.display_buffer = np.empty((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+
+        # Camera feed section
+        camera_frame = tk.Frame(self, width=640, height=480)
+        camera_frame.pack(side=tk.LEFT, padx=10, pady=10)
+        self.camera_label = tk.Label(camera_frame)
+        self.camera_label.pack()
+
+        # Color list section
+        self.color_frame = tk.Frame(self, width=200, height=480)
+        self.color_frame.pack(side=tk.RIGHT, padx=10, pady=10)
+
+        # Add a result label above the pins
+        self.result_label = tk.Label(self.color_frame, text="Result: ", font=("Arial", 12, "bold"))
+        self.result_label.pack(anchor=tk.W, pady=10)
+
+    def start(self):
+        """Start inspecting the frames of the camera session"""
+        if self.pipeline is None:
+            self.inspector.reset()  # The fixture may have changed while stopped
+            self.pipeline = Pipeline(self.session, self.inspector.inspect, self.stats)
+            self.pipeline.start()
+
+    def stop(self):
+        """Stop the detection thread, the camera session keeps running"""
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    def clear(self):
+        self.camera_label.config(image="")
+        self.camera_label.image = None
+
+    def set_cable(self, cable):
+        """Switch the profile, labels are only rebuilt when the pin names differ"""
+        # The store compiles each cable profile once, swapping the plan is a single
+        # assignment the detection worker picks up on its next frame
+        self.cable = cable
+        snapshot = self.config_store.snapshot
+        self.swap_plan(snapshot)
+        pin_names = [pin_name for pin_name, _ in snapshot.config[CABLES[cable][0]]]
+        if self.pin_names == pin_names:
+            return  # Same pins, keep the labels and the verdicts they show
+
+        # Clear existing labels
+        for label in self.color_labels:
+            label.destroy()
+        self.color_labels.clear()
+
+        # Create new labels for the updated color list
+        for pin_name in pin_names:
+            label = tk.Label(self.color_frame, text=pin_name, image=self.red_icon, compound=tk.LEFT, fg="red")
+            label.pack(anchor=tk.W, pady=2)
+            self.color_labels.append(label)
+        self.pin_names = pin_names
+        self.shown_matches = np.zeros(len(self.color_labels), dtype=bool)  # New labels start red
+        self.shown_texts = list(pin_names)
+
+    def swap_plan(self, snapshot):
+        """Use the plan of a new configuration snapshot, safe to call from any thread"""
+        inspector = self.inspector
+        inspector.plan = snapshot.plans[self.cable]
+        inspector.gate_enabled = snapshot.flag("CHANGE_GATE", True)
+        inspector.presence_enabled = snapshot.flag("PRESENCE")
+        inspector.stabilize_enabled = snapshot.flag("STABILIZE", True)
+        inspector.locate_enabled = snapshot.flag("AUTO_LOCATE")
+        inspector.aligner.every = snapshot.config["LOCATE_EVERY"]
+
+    def learn_empty_fixture(self):
+        """Take the next frame as the empty fixture, for when a cable was seated at startup"""
+        self.inspector.relearn = True  # Applied by the detection worker, which owns the tracker
+
+    def render(self):
+        """Draw the latest detection result if there is one, runs on the Tk thread"""
+        pipeline = self.pipeline
+        result = pipeline.results.get_nowait() if pipeline is not None else None
+        if result is None:
+            return
+        raw, pins, matches, wiring = result
+
+        # Color conversion and resize are only needed for display, at display rate.
+        # Shrink first so the conversion runs on the small frame, both write into
+        # the display buffer, and the camera buffer goes back to the capture pool
+        with self.stats.time("resize"):
+            frame = cv2.resize(raw, FRAME_SIZE, dst=self.display_buffer)
+        pipeline.release(raw)
+        with self.stats.time("bgr2rgb"):
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.display_buffer)
+
+        with self.stats.time("overlay"):
+            for pin_name, roi in pins:
+                # Draw the ROI on the frame for visualization
+                x, y, w, h = roi
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                cv2.putText(frame, pin_name, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+        with self.stats.time("display"):
+            img = ImageTk.PhotoImage(image=Image.fromarray(frame))
+            self.camera_label.config(image=img)
+            self.camera_label.image = img
+
+        self.schedule_verdict_update(matches, wiring)
+        while self.inspector.finished_parts:
+            record = self.inspector.finished_parts.popleft()
+            if self.on_part is not None:
+                self.on_part(self, record)
+        self.stats.tick("display")
+
+    def schedule_verdict_update(self, matches, wiring=None):
+        """Queue the newest pin verdicts, several frames in a row are coalesced into one idle callback"""
+        if not self.update_pending:
+            self.after_idle(self.apply_verdict_update)
+            self.update_pending = True
+        self.pending_matches = None if matches is None else np.asarray(matches, dtype=bool)
+        self.pending_wiring = wiring
+
+    def apply_verdict_update(self):
+        """Update only the pin and result labels whose verdict changed since the last update"""
+        matches = self.pending_matches
+        wiring = self.pending_wiring
+        self.pending_matches = self.pending_wiring = None
+        self.update_pending = False
+        seated = matches is not None
+        if not seated:
+            matches = np.zeros(len(self.color_labels), dtype=bool)
+
+        with self.stats.time("widgets"):
+            count = min(len(matches), len(self.color_labels))  # Labels may have been rebuilt meanwhile
+            if self.shown_matches is None or len(self.shown_matches) != count:
+                changed = range(count)
+            else:
+                changed = np.flatnonzero(matches[:count] != self.shown_matches).tolist()
+            for i in changed:
+                if matches[i]:
+                    self.color_labels[i].config(image=self.green_icon, fg="green")
+                else:
+                    self.color_labels[i].config(image=self.red_icon, fg="red")
+            self.shown_matches = matches[:count].copy()
+
+            # Failed pins tell whose wire they hold, when it is another pin's
+            for i in range(count):
+                text = self.pin_names[i]
+                if wiring is not None and i < len(wiring) and not matches[i] and wiring[i] != i:
+                    held = wiring[i]
+                    text += " (wrong wire)" if held == WRONG_WIRE else f" (has {self.pin_names[held]})"
+                if text != self.shown_texts[i]:
+                    self.color_labels[i].config(text=text)
+                    self.shown_texts[i] = text
+
+            # Update the result label only when the overall verdict flips
+            all_green = bool(matches.all()) if seated else None
+            if all_green != self.ok:
+                if all_green is None:
+                    self.result_label.config(text="Result: NO CABLE", fg="gray")
+                elif all_green:
+                    self.result_label.config(text="Result: OK", fg="green")
+                else:
+                    self.result_label.config(text="Result: NOT OK", fg="red")
+                self.ok = all_green
+                if self.on_result is not None:
+                    self.on_result(self)
@@ -0,0 +1,70 @@
+import itertools
+
+import numpy as np
+
+from wiring import WRONG_WIRE, assign, format_wiring, identify_wiring, wiring_faults
+
+NAMES = ["Pin 1", "Pin 2", "Pin 3", "Pin 4"]
+EXPECTED = np.array([[200, 30, 30], [30, 200, 30], [30, 30, 200], [200, 200, 30]])
+TOLERANCE = 20
+
+
+# Function to get the inputs of identify_wiring() for ROIs showing `colors`, with the
+# largest per-channel difference as the distance like the rgb metric
+def inspect(colors):
+    colors = np.asarray(colors)
+    matrix = np.abs(colors[:, np.newaxis, :] - EXPECTED[np.newaxis, :, :]).max(axis=2)
+    tolerances = np.full(len(EXPECTED), TOLERANCE)
+    matches = matrix.diagonal() <= tolerances
+    return matrix, tolerances, matches
+
+
+def test_assign_matches_brute_force():
+    random = np.random.default_rng(0)
+    for _ in range(400):
+        n = int(random.integers(1, 7))
+        cost = random.integers(0, 50, (n, n)).astype(float)
+        columns = assign(cost)
+        assert sorted(columns.tolist()) == list(range(n))
+        best = min(cost[np.arange(n), list(permutation)].sum() for permutation in itertools.permutations(range(n)))
+        assert cost[np.arange(n), columns].sum() == best
+
+
+def test_correct_cable_keeps_every_wire():
+    wiring = identify_wiring(*inspect(EXPECTED))
+    assert wiring.tolist() == [0, 1, 2, 3]
+    assert wiring_faults(NAMES, wiring) == []
+
+
+def test_swapped_wires():
+    wiring = identify_wiring(*inspect(EXPECTED[[0, 2, 1, 3]]))
+    assert wiring.tolist() == [0, 2, 1, 3]
+    assert format_wiring(wiring_faults(NAMES, wiring)) == "Pin 2 <-> Pin 3"
+
+
+def test_wrong_wire():
+    colors = EXPECTED.copy()
+    colors[3] = [128, 128, 128]
+    wiring = identify_wiring(*inspect(colors))
+    assert wiring.tolist() == [0, 1, 2, WRONG_WIRE]
+    assert wiring_faults(NAMES, wiring) == [{"pin": "Pin 4", "holds": None}]
+    assert format_wiring(wiring_faults(NAMES, wiring)) == "Pin 4 wrong wire"
+
+
+def test_wrong_wire_does_not_break_a_swap():
+    # A far-off color must not pull the swapped wires into another assignment
+    colors = EXPECTED[[0, 2, 1, 3]].copy()
+    colors[0] = [0, 0, 0]
+    wiring = identify_wiring(*inspect(colors))
+    assert wiring.tolist() == [WRONG_WIRE, 2, 1, 3]
+    assert format_wiring(wiring_faults(NAMES, wiring)) == "Pin 1 wrong wire, Pin 2 <-> Pin 3"
+
+
+def test_wire_moved_to_another_pin():
+    # Pin 2 holds Pin 3's wire, Pin 3 holds one of no expected color
+    colors = EXPECTED.copy()
+    colors[1] = EXPECTED[2]
+    colors[2] = [128, 128, 128]
+    wiring = identify_wiring(*inspect(colors))
+    assert wiring.tolist() == [0, 2, WRONG_WIRE, 3]
+    assert format_wiring(wiring_faults(NAMES, wiring)) == "Pin 2 has Pin 3, Pin 3 wrong wire"
@@ -0,0 +1,108 @@
+"""Wire-order identification.
+
+A failed pin can mean two things: its wire is in the wrong position, or it
+is the wrong color altogether. For every failed ROI, the distance of its
+mean color to the expected color of every other failed pin is read from
+the plan's N x N distance matrix, and an optimal assignment pairs ROIs with
+pins at the smallest total distance, where every distance beyond a pin's
+tolerance counts the same. An ROI assigned to another pin's color within
+that pin's tolerance holds that pin's wire; an ROI that fits none of the
+remaining colors holds a wrong wire.
+
+Pins that pass stay where they are, so a correctly wired cable costs
+nothing beyond the verdict, and a single swap only solves a 2 x 2 problem.
+"""
+import numpy as np
+
+WRONG_WIRE = -1  # Placeholder in a wiring for ROIs that show none of the expected colors
+
+
+# Function to solve the assignment problem on a square cost matrix (Hungarian method with
+# potentials, O(n^3) with the inner loop over columns vectorized), returns the column of every row
+def assign(cost):
+    cost = np.asarray(cost, dtype=float)
+    n = len(cost)
+    u = np.zeros(n + 1)  # Row potentials, index 0 is a sentinel
+    v = np.zeros(n + 1)  # Column potentials
+    row_of = np.zeros(n + 1, dtype=int)  # 1-based row assigned to each column, 0 when free
+    way = np.zeros(n + 1, dtype=int)
+    for row in range(1, n + 1):
+        row_of[0] = row
+        column = 0
+        minv = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
+        while True:
+            # Grow the alternating tree by the cheapest free column
+            used[column] = True
+            reduced = cost[row_of[column] - 1] - u[row_of[column]] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(free, minv[1:], np.inf)
+            next_column = int(candidates.argmin()) + 1
+            delta = candidates[next_column - 1]
+            u[row_of[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            column = next_column
+            if row_of[column] == 0:
+                break
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            row_of[column] = row_of[previous]
+            column = previous
+    assignment = np.empty(n, dtype=int)
+    assignment[row_of[1:] - 1] = np.arange(n)
+    return assignment
+
+
+# Function to find which pin's wire every ROI holds. `matrix` holds the distance of every ROI mean
+# (rows) to every expected color (columns), `tolerances` the tolerance of every pin and `matches`
+# the verdict of every pin. Returns an index per ROI: itself when it passes, the pin whose wire
+# it holds, or WRONG_WIRE.
+def identify_wiring(matrix, tolerances, matches):
+    wiring = np.arange(len(matches))
+    failed = np.flatnonzero(~np.asarray(matches, dtype=bool))
+    if not failed.size:
+        return wiring
+    # Any color beyond a pin's tolerance is equally wrong, a far-off wire must not pull the others around
+    limits = np.asarray(tolerances, dtype=float)[failed] + 1
+    cost = np.minimum(matrix[np.ix_(failed, failed)], limits[np.newaxis, :])
+    cost[np.diag_indices_from(cost)] -= 0.5  # On ties, a wire stays in its own position
+    nearest = cost.argmin(axis=1)
+    # When every ROI's nearest color is a different pin, that already is the optimal assignment
+    if len(np.unique(nearest)) == len(nearest):
+        columns = nearest
+    else:
+        columns = assign(cost)
+    held = failed[columns]
+    fits = matrix[failed, held] <= np.asarray(tolerances)[held]
+    wiring[failed] = np.where(fits, held, WRONG_WIRE)
+    return wiring
+
+
+# Function to list the wiring faults for reports, one {"pin", "holds"} entry per misplaced or
+# wrong wire, "holds" is None for a wire of none of the expected colors
+def wiring_faults(names, wiring):
+    return [{"pin": names[i], "holds": None if held == WRONG_WIRE else names[held]}
+            for i, held in enumerate(wiring.tolist()) if held != i]
+
+
+# Function to describe wiring faults from wiring_faults() in a few words, such as "Pin 3 <-> Pin 5, Pin 7 wrong wire"
+def format_wiring(faults):
+    holds = {fault["pin"]: fault["holds"] for fault in faults}
+    parts = []
+    seen = set()
+    for pin, held in holds.items():
+        if pin in seen:
+            continue
+        if held is None:
+            parts.append(f"{pin} wrong wire")
+        elif holds.get(held) == pin:
+            parts.append(f"{pin} <-> {held}")
+            seen.add(held)
+        else:
+            parts.append(f"{pin} has {held}")
+    return ", ".join(parts)